@@ -6,27 +6,36 @@
 # GitHub: https://github.com/filmdc/smart-social-gallery-poster
 
 import os
+import errno
 import hashlib
 import cv2
 import json
 import shutil
+import stat
+import tempfile
 import re
 import sqlite3
 import time
-import glob
 import sys
 import subprocess
 import base64
 import zipfile
 import io
-from flask import Flask, render_template, send_from_directory, abort, send_file, url_for, redirect, request, jsonify, Response
-from PIL import Image, ImageSequence
+import itertools
+import functools
+import mmap
+from flask import Flask, render_template, send_from_directory, abort, send_file, url_for, redirect, request, jsonify, Response, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from PIL import Image, ImageSequence, PngImagePlugin
 import colorsys
 from werkzeug.utils import secure_filename
 import concurrent.futures
+import multiprocessing
 from tqdm import tqdm
 import threading
+import queue
 import uuid
+import zlib
 # Try to import tkinter for GUI dialogs, but make it optional for Docker/headless environments
 try:
     import tkinter as tk
@@ -35,8 +44,15 @@ try:
 except ImportError:
     TKINTER_AVAILABLE = False
     # tkinter not available (e.g., in Docker containers) - will fall back to console output
+# orjson is optional: when installed, JSON responses are serialized with it instead of the stdlib
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 import urllib.request 
-import secrets
+import urllib.error
+import requests
 
 
 # ============================================================================
@@ -65,53 +81,81 @@ import secrets
 # Remember: environment variables take priority over these default values.
 # ============================================================================
 
+# Snapshot of the environment, read once for all settings below
+_ENV = dict(os.environ)
+
+def _env(name, default, cast=str):
+    """Setting from the environment converted with cast; default if unset, empty or malformed."""
+    value = _ENV.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        print(f"WARNING: Invalid value {name}={value!r}, using default {default!r}")
+        return default
+
 # Path to the main media/assets folder.
-BASE_OUTPUT_PATH = os.environ.get('BASE_OUTPUT_PATH', '/app/data')
+BASE_OUTPUT_PATH = _ENV.get('BASE_OUTPUT_PATH', '/app/data')
 
 # Path to source/input media folder (for reference lookups).
-BASE_INPUT_PATH = os.environ.get('BASE_INPUT_PATH', '/app/data')
+BASE_INPUT_PATH = _ENV.get('BASE_INPUT_PATH', '/app/data')
 
 # Path for service folders (database, cache, zip files).
 # If not specified, the assets output path will be used.
 # These sub-folders won't appear in the gallery.
-BASE_SMARTGALLERY_PATH = os.environ.get('BASE_SMARTGALLERY_PATH', BASE_OUTPUT_PATH)
+BASE_SMARTGALLERY_PATH = _ENV.get('BASE_SMARTGALLERY_PATH', BASE_OUTPUT_PATH)
 
 # Path to ffprobe executable (part of ffmpeg).
 # Required for video metadata extraction.
-FFPROBE_MANUAL_PATH = os.environ.get('FFPROBE_MANUAL_PATH', "/usr/bin/ffprobe")
+FFPROBE_MANUAL_PATH = _ENV.get('FFPROBE_MANUAL_PATH', "/usr/bin/ffprobe")
 
 # Path to ffmpeg executable (for video processing).
-FFMPEG_MANUAL_PATH = os.environ.get('FFMPEG_MANUAL_PATH', "/usr/bin/ffmpeg")
+FFMPEG_MANUAL_PATH = _ENV.get('FFMPEG_MANUAL_PATH', "/usr/bin/ffmpeg")
 
 # Port on which the gallery web server will run.
-SERVER_PORT = int(os.environ.get('PORT', os.environ.get('SERVER_PORT', 8189)))
+SERVER_PORT = _env('PORT', _env('SERVER_PORT', 8189, int), int)
 
 # Width (in pixels) of the generated thumbnails.
-THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', 300))
+THUMBNAIL_WIDTH = _env('THUMBNAIL_WIDTH', 300, int)
 
 # Thumbnail format: 'webp' (smaller files) or 'jpeg' (faster, more compatible)
-THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'webp').lower()
+THUMBNAIL_FORMAT = _ENV.get('THUMBNAIL_FORMAT', 'webp').lower()
 if THUMBNAIL_FORMAT not in ('webp', 'jpeg', 'jpg'):
     THUMBNAIL_FORMAT = 'webp'
 
 # Thumbnail quality (1-100). Lower = smaller files, less quality.
 # Recommended: 60-75 for webp, 70-85 for jpeg
-THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 70 if THUMBNAIL_FORMAT == 'webp' else 80))
+THUMBNAIL_QUALITY = _env('THUMBNAIL_QUALITY', 70 if THUMBNAIL_FORMAT == 'webp' else 80, int)
+
+# Let the front-end web server stream files instead of the Flask worker.
+# USE_X_SENDFILE=true makes send_file() emit an X-Sendfile header (Apache mod_xsendfile, lighttpd).
+# THUMBNAIL_ACCEL_REDIRECT_PREFIX (e.g. /thumbnail_cache/) sends thumbnails with an nginx
+# X-Accel-Redirect to an internal location aliased to the thumbnail cache folder.
+# Only enable these when the web server is configured for them, or responses will be empty.
+USE_X_SENDFILE = _ENV.get('USE_X_SENDFILE', 'false').lower() == 'true'
+THUMBNAIL_ACCEL_REDIRECT_PREFIX = _ENV.get('THUMBNAIL_ACCEL_REDIRECT_PREFIX', '')
 
 # Assumed frame rate for animated WebP files.
-WEBP_ANIMATED_FPS = float(os.environ.get('WEBP_ANIMATED_FPS', 16.0))
+WEBP_ANIMATED_FPS = _env('WEBP_ANIMATED_FPS', 16.0, float)
 
 # ZIP compression level (0-9). Higher = smaller files but slower.
 # 0 = store only (no compression), 6 = default, 9 = maximum compression
-ZIP_COMPRESSION_LEVEL = int(os.environ.get('ZIP_COMPRESSION_LEVEL', 6))
+ZIP_COMPRESSION_LEVEL = _env('ZIP_COMPRESSION_LEVEL', 6, int)
 if ZIP_COMPRESSION_LEVEL < 0:
     ZIP_COMPRESSION_LEVEL = 0
 elif ZIP_COMPRESSION_LEVEL > 9:
     ZIP_COMPRESSION_LEVEL = 9
+# Formats that are already compressed; batch downloads store them without deflating
+ZIP_STORED_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg', '.jfif', '.webp', '.gif',
+                                   '.mp4', '.mkv', '.webm', '.mov', '.avi',
+                                   '.mp3', '.ogg', '.flac'})
+# Read size when copying stored entries into a ZIP
+ZIP_COPY_BUFFER_SIZE = 1024 * 1024
 
 # Maximum number of files to load initially before showing a "Load more" button.  
 # Use a very large number (e.g., 9999999) for "infinite" loading.
-PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 100))
+PAGE_SIZE = _env('PAGE_SIZE', 100, int)
 
 # Names of special folders (e.g., 'video', 'audio').  
 # These folders will appear in the menu only if they exist inside BASE_OUTPUT_PATH.  
@@ -121,60 +165,44 @@ SPECIAL_FOLDERS = ['video', 'audio']
 # Number of files to process at once during database sync. 
 # Higher values use more memory but may be faster. 
 # Lower this if you run out of memory.
-BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 500))
+BATCH_SIZE = _env('BATCH_SIZE', 500, int)
 
 # Number of parallel processes to use for thumbnail and metadata generation.
 # - None or empty string: use all available CPU cores (fastest, recommended)
 # - 1: disable parallel processing (slowest, like in previous versions)
 # - Specific number (e.g., 4): limit CPU usage on multi-core machines
-MAX_PARALLEL_WORKERS = os.environ.get('MAX_PARALLEL_WORKERS', None)
-if MAX_PARALLEL_WORKERS is not None and MAX_PARALLEL_WORKERS != "":
-    MAX_PARALLEL_WORKERS = int(MAX_PARALLEL_WORKERS)
-else:
-    MAX_PARALLEL_WORKERS = None
+MAX_PARALLEL_WORKERS = _env('MAX_PARALLEL_WORKERS', None, int)
+
+# Kind of worker pool used for thumbnail and metadata generation.
+# - 'process' (default): one process per worker; Python-level work such as workflow parsing runs in parallel
+# - 'thread': threads in the server process; no start-up or pickling cost, and OpenCV/Pillow
+#   decoding and ffprobe calls still overlap, which often wins on fast disks or spawn-based platforms
+WORKER_POOL_KIND = _ENV.get('WORKER_POOL_KIND', 'process').lower()
+if WORKER_POOL_KIND not in ('process', 'thread'):
+    WORKER_POOL_KIND = 'process'
+
+# Number of smash cut jobs allowed to run ffmpeg at the same time.
+# Additional jobs wait in a queue until a worker is free.
+SMASHCUT_MAX_CONCURRENT_JOBS = max(1, _env('SMASHCUT_MAX_CONCURRENT_JOBS', 1, int))
 
 # Flask secret key
 # You can set it in the environment variable SECRET_KEY
 # If not set, it will be generated randomly
-SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_hex(32))
+SECRET_KEY = _ENV.get('SECRET_KEY')
+if SECRET_KEY is None:
+    import secrets  # Only needed to generate a key
+    SECRET_KEY = secrets.token_hex(32)
 
 # Optional path where deleted files will be moved instead of being permanently deleted.
 # If set, files will be moved to DELETE_TO/SmartAssetGallery/<timestamp>_<filename>
 # If not set (None or empty string), files will be permanently deleted as before.
 # The path MUST exist and be writable, or the application will exit with an error.
 # Example: /path/to/trash or C:/Trash
-DELETE_TO = os.environ.get('DELETE_TO', None)
+DELETE_TO = _ENV.get('DELETE_TO', '').strip() or None
+TRASH_FOLDER = os.path.join(DELETE_TO, 'SmartAssetGallery') if DELETE_TO else None
 
 # External workflow tool URL (e.g., ComfyUI). Used for "send to" feature.
-COMFYUI_URL = os.environ.get('COMFYUI_URL', 'http://127.0.0.1:8188')
-if DELETE_TO and DELETE_TO.strip():
-    DELETE_TO = DELETE_TO.strip()
-    TRASH_FOLDER = os.path.join(DELETE_TO, 'SmartAssetGallery')
-    
-    # Validate that DELETE_TO path exists
-    if not os.path.exists(DELETE_TO):
-        print(f"{Colors.RED}{Colors.BOLD}CRITICAL ERROR: DELETE_TO path does not exist: {DELETE_TO}{Colors.RESET}")
-        print(f"{Colors.RED}Please create the directory or unset the DELETE_TO environment variable.{Colors.RESET}")
-        sys.exit(1)
-    
-    # Validate that DELETE_TO is writable
-    if not os.access(DELETE_TO, os.W_OK):
-        print(f"{Colors.RED}{Colors.BOLD}CRITICAL ERROR: DELETE_TO path is not writable: {DELETE_TO}{Colors.RESET}")
-        print(f"{Colors.RED}Please check permissions or unset the DELETE_TO environment variable.{Colors.RESET}")
-        sys.exit(1)
-    
-    # Validate that trash subfolder exists or can be created
-    if not os.path.exists(TRASH_FOLDER):
-        try:
-            os.makedirs(TRASH_FOLDER)
-            print(f"{Colors.GREEN}Created trash folder: {TRASH_FOLDER}{Colors.RESET}")
-        except OSError as e:
-            print(f"{Colors.RED}{Colors.BOLD}CRITICAL ERROR: Cannot create trash folder: {TRASH_FOLDER}{Colors.RESET}")
-            print(f"{Colors.RED}Error: {e}{Colors.RESET}")
-            sys.exit(1)
-else:
-    DELETE_TO = None
-    TRASH_FOLDER = None
+COMFYUI_URL = _ENV.get('COMFYUI_URL', 'http://127.0.0.1:8188')
 
 
 # ============================================================================
@@ -188,6 +216,7 @@ SQLITE_CACHE_FOLDER_NAME = '.sqlite_cache'
 DATABASE_FILENAME = 'gallery_cache.sqlite'
 ZIP_CACHE_FOLDER_NAME = '.zip_downloads'
 SMASHCUT_FOLDER_NAME = '.smashcut_output'  
+UPDATE_CHECK_CACHE_FILENAME = 'update_check.json'
 
 # --- APP INFO ---
 APP_VERSION = 2.0
@@ -197,10 +226,13 @@ GITHUB_RAW_URL = "https://raw.githubusercontent.com/filmdc/smart-social-gallery-
 
 
 # --- HELPER FUNCTIONS (DEFINED FIRST) ---
+# Both directions are pure functions of their argument, so the memoized results never go stale
+@functools.lru_cache(maxsize=4096)
 def path_to_key(relative_path):
     if not relative_path: return '_root_'
     return base64.urlsafe_b64encode(relative_path.replace(os.sep, '/').encode()).decode()
 
+@functools.lru_cache(maxsize=4096)
 def key_to_path(key):
     if key == '_root_': return ''
     try:
@@ -223,12 +255,13 @@ def format_folder_display_name(folder_name):
     return name if name else folder_name
 
 # --- DERIVED SETTINGS ---
-DB_SCHEMA_VERSION = 28
+DB_SCHEMA_VERSION = 31
 THUMBNAIL_CACHE_DIR = os.path.join(BASE_SMARTGALLERY_PATH, THUMBNAIL_CACHE_FOLDER_NAME)
 SQLITE_CACHE_DIR = os.path.join(BASE_SMARTGALLERY_PATH, SQLITE_CACHE_FOLDER_NAME)
 DATABASE_FILE = os.path.join(SQLITE_CACHE_DIR, DATABASE_FILENAME)
 ZIP_CACHE_DIR = os.path.join(BASE_SMARTGALLERY_PATH, ZIP_CACHE_FOLDER_NAME)
 SMASHCUT_OUTPUT_DIR = os.path.join(BASE_SMARTGALLERY_PATH, SMASHCUT_FOLDER_NAME)
+BASE_INPUT_ABSPATH = os.path.abspath(BASE_INPUT_PATH)
 PROTECTED_FOLDER_KEYS = {path_to_key(f) for f in SPECIAL_FOLDERS}
 PROTECTED_FOLDER_KEYS.add('_root_')
 
@@ -244,6 +277,11 @@ class Colors:
     RESET = '\033[0m'
     BOLD = '\033[1m'
 
+# Plain output when stdout is piped to a log file, or when NO_COLOR is set (no-color.org)
+if _ENV.get('NO_COLOR') or not (sys.stdout and sys.stdout.isatty()):
+    for _name in [n for n in vars(Colors) if n.isupper()]:
+        setattr(Colors, _name, '')
+
 def print_configuration():
     """Prints the current configuration in a neat, aligned table."""
     print(f"\n{Colors.HEADER}{Colors.BOLD}--- CURRENT CONFIGURATION ---{Colors.RESET}")
@@ -265,10 +303,11 @@ def print_configuration():
     print_row("Page Size", PAGE_SIZE)
     print_row("Batch Size", BATCH_SIZE)
     print_row("Max Parallel Workers", MAX_PARALLEL_WORKERS if MAX_PARALLEL_WORKERS else "All Cores")
+    print_row("Worker Pool", WORKER_POOL_KIND)
     print(f"{Colors.HEADER}-----------------------------{Colors.RESET}\n")
 
 # --- SOCIAL FEATURES ---
-SOCIAL_FEATURES_ENABLED = os.environ.get('SOCIAL_FEATURES_ENABLED', 'true').lower() == 'true'
+SOCIAL_FEATURES_ENABLED = _ENV.get('SOCIAL_FEATURES_ENABLED', 'true').lower() == 'true'
 
 # --- WHITE LABEL / BRANDING ---
 # Customize the application name and branding
@@ -276,9 +315,9 @@ SOCIAL_FEATURES_ENABLED = os.environ.get('SOCIAL_FEATURES_ENABLED', 'true').lowe
 # SITE_TAGLINE: Optional tagline/subtitle shown on login and startup (default: organization name or empty)
 # SITE_LOGO_PATH: Path to a custom logo image file (PNG, JPG, SVG). If not set, no logo is displayed.
 #                 The path can be absolute or relative to BASE_SMARTGALLERY_PATH.
-SITE_NAME = os.environ.get('SITE_NAME', 'Smart Asset Gallery')
-SITE_TAGLINE = os.environ.get('SITE_TAGLINE', '')
-SITE_LOGO_PATH = os.environ.get('SITE_LOGO_PATH', '')
+SITE_NAME = _ENV.get('SITE_NAME', 'Smart Asset Gallery')
+SITE_TAGLINE = _ENV.get('SITE_TAGLINE', '')
+SITE_LOGO_PATH = _ENV.get('SITE_LOGO_PATH', '')
 
 def get_branding():
     """Get the current branding configuration as a dictionary.
@@ -329,10 +368,43 @@ def get_branding():
     }
 
 # --- FLASK APP INITIALIZATION ---
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson. Anything orjson rejects (e.g. integers wider than
+    64 bits in a workflow) falls back to the default stdlib-based provider.
+    """
+    def dumps(self, obj, **kwargs):
+        try:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS).decode('utf-8')
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            return super().loads(s, **kwargs)
+
+def parse_workflow_json(s):
+    """
+    json.loads() for workflow JSON, through orjson when it is installed. Anything orjson
+    rejects (integers wider than 64 bits, NaN, lone surrogates) is retried with the stdlib.
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s)
+
 app = Flask(__name__)
+if ORJSON_AVAILABLE:
+    app.json = OrjsonProvider(app)
 app.secret_key = SECRET_KEY
-gallery_view_cache = []
+app.use_x_sendfile = USE_X_SENDFILE
 folder_config_cache = None
+folder_config_cache_time = 0.0
+folder_config_lock = threading.Lock()
 FFPROBE_EXECUTABLE_PATH = None
 
 
@@ -345,6 +417,8 @@ def inject_branding():
 
 # Data structures for node categorization and analysis
 NODE_CATEGORIES_ORDER = ["input", "model", "processing", "output", "others"]
+# Sort rank of each category, so ordering nodes doesn't scan NODE_CATEGORIES_ORDER per node
+_CATEGORY_RANK = {category: rank for rank, category in enumerate(NODE_CATEGORIES_ORDER)}
 NODE_CATEGORIES = {
     "Load Checkpoint": "input", "CheckpointLoaderSimple": "input", "Empty Latent Image": "input",
     "CLIPTextEncode": "input", "Load Image": "input",
@@ -382,12 +456,16 @@ _node_colors_cache = {}
 def get_node_color(node_type):
     """Generates a unique and consistent color for a node type."""
     if node_type not in _node_colors_cache:
-        # Use a hash to get a consistent color for the same node type
-        hue = (hash(node_type + "a_salt_string") % 360) / 360.0
+        # CRC32 rather than hash(), which is randomized per process, so colors don't change between restarts
+        hue = (zlib.crc32(node_type.encode('utf-8', 'surrogatepass')) % 360) / 360.0
         rgb = [int(c * 255) for c in colorsys.hsv_to_rgb(hue, 0.7, 0.85)]
         _node_colors_cache[node_type] = f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
     return _node_colors_cache[node_type]
 
+# Known node types are colored up front; others are added on first use
+for _node_type in NODE_CATEGORIES:
+    get_node_color(_node_type)
+
 def filter_enabled_nodes(workflow_data):
     """Filters and returns only active nodes and links (mode=0) from a workflow."""
     if not isinstance(workflow_data, dict): return {'nodes': [], 'links': []}
@@ -401,67 +479,128 @@ def filter_enabled_nodes(workflow_data):
     ]
     return {"nodes": active_nodes, "links": active_links}
 
+# Media extensions that mark a workflow parameter as a reference to an input file
+_VALID_MEDIA_EXTS = frozenset({
+    '.png', '.jpg', '.jpeg', '.webp', '.gif', '.jfif', '.bmp', '.tiff',
+    '.mp4', '.mov', '.webm', '.mkv', '.avi',
+    '.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac'
+})
+
+# Workflow tool suffixes like ' [output]' or ' [input]' at the end of a file parameter
+_SUFFIX_RE = re.compile(r'\s*\[.*?\]$')
+
+# Node types that contain model/checkpoint names
+CHECKPOINT_NODES = {
+    "CheckpointLoaderSimple": ["ckpt_name"],
+    "Load Checkpoint": ["ckpt_name"],
+    "CheckpointLoader": ["ckpt_name"],
+    "ModelMerger": ["ckpt_name1", "ckpt_name2"],
+    "UNETLoader": ["unet_name"],
+    "DiffusersLoader": ["model_path"],
+}
+
+# Node types that contain LoRA names
+LORA_NODES = {
+    "LoraLoader": ["lora_name"],
+    "LoraLoaderModelOnly": ["lora_name"],
+    "Load LoRA": ["lora_name"],
+    "Lora Loader": ["lora_name"],
+    "LoRALoader": ["lora_name"],
+    "LoraLoaderBlockWeight": ["lora_name"],
+}
+
+# Node type -> [(bucket, parameter name)] in widget order, so models and LoRAs are
+# collected with one lookup per node
+_EXTRACT_RULES = {node_type: [('model', param) for param in params] for node_type, params in CHECKPOINT_NODES.items()}
+_EXTRACT_RULES.update({node_type: [('lora', param) for param in params] for node_type, params in LORA_NODES.items()})
+
+def _get_workflow_nodes(workflow_data):
+    """
+    Returns (nodes, is_api_format) for a parsed workflow. UI workflows are reduced to
+    their active nodes; API prompts become node dicts with 'id', 'type' and 'inputs'.
+    """
+    if 'nodes' in workflow_data and isinstance(workflow_data['nodes'], list):
+        return filter_enabled_nodes(workflow_data).get('nodes', []), False
+    nodes = []
+    for node_id, node_data in workflow_data.items():
+        if isinstance(node_data, dict) and 'class_type' in node_data:
+            node_entry = node_data.copy()
+            node_entry['id'] = node_id
+            node_entry['type'] = node_data['class_type']
+            node_entry['inputs'] = node_data.get('inputs', {})
+            nodes.append(node_entry)
+    return nodes, True
+
+@functools.lru_cache(maxsize=32)
+def parse_workflow_nodes(workflow_json_string):
+    """
+    Parses a workflow JSON string into (nodes, is_api_format) via _get_workflow_nodes().
+    Memoized, so the node summary and the indexing pass don't parse the same workflow
+    again; the nodes are shared between callers and must not be modified.
+    Raises json.JSONDecodeError (or TypeError) like json.loads().
+    """
+    nodes, is_api_format = _get_workflow_nodes(parse_workflow_json(workflow_json_string))
+    return tuple(nodes), is_api_format
+
+def _get_node_params(node, node_type, is_api_format):
+    """Parameter name -> value for a node; UI widget values are named via NODE_PARAM_NAMES."""
+    if is_api_format:
+        return node.get('inputs', {})
+    widgets_values = node.get('widgets_values', [])
+    param_names_list = NODE_PARAM_NAMES.get(node_type, ())
+    raw_params = dict(zip(param_names_list, widgets_values))
+    # Widgets beyond the known names are numbered from 1
+    tail = itertools.islice(widgets_values, len(param_names_list), None)
+    for i, value in enumerate(tail, len(param_names_list) + 1):
+        raw_params[f"param_{i}"] = value
+    return raw_params
+
+def _clean_media_reference(value):
+    """Normalized file reference if value names a media file (suffixes like ' [input]' removed), else None."""
+    if not isinstance(value, str):
+        return None
+    clean_value = value.replace('\\', '/').strip()
+    if clean_value.endswith(']'):
+        clean_value = _SUFFIX_RE.sub('', clean_value)
+    # Cheap rejection of the many non-file params; splitext (which ignores a name's leading dots) confirms hits
+    ext_pos = clean_value.rfind('.')
+    if ext_pos == -1 or clean_value[ext_pos:].lower() not in _VALID_MEDIA_EXTS:
+        return None
+    return clean_value if os.path.splitext(clean_value)[1].lower() in _VALID_MEDIA_EXTS else None
+
 def generate_node_summary(workflow_json_string):
     """
     Analyzes a workflow JSON, extracts active nodes, and identifies input media.
     Robust version: handles workflow tool suffixes like ' [output]'.
     """
     try:
-        workflow_data = json.loads(workflow_json_string)
+        nodes, is_api_format = parse_workflow_nodes(workflow_json_string)
     except json.JSONDecodeError:
         return None
 
-    nodes = []
-    is_api_format = False
-
-    if 'nodes' in workflow_data and isinstance(workflow_data['nodes'], list):
-        active_workflow = filter_enabled_nodes(workflow_data)
-        nodes = active_workflow.get('nodes', [])
-    else:
-        is_api_format = True
-        for node_id, node_data in workflow_data.items():
-            if isinstance(node_data, dict) and 'class_type' in node_data:
-                node_entry = node_data.copy()
-                node_entry['id'] = node_id
-                node_entry['type'] = node_data['class_type']
-                node_entry['inputs'] = node_data.get('inputs', {})
-                nodes.append(node_entry)
-
     if not nodes:
         return []
 
     def get_id_safe(n):
-        try: return int(n.get('id', 0))
-        except: return str(n.get('id', 0))
+        # Numeric ids sort numerically and ahead of any others (e.g. '5:2' inside group nodes),
+        # which keeps ints and strs from being compared with each other
+        node_id = n.get('id', 0)
+        if isinstance(node_id, int): return (0, node_id)
+        if isinstance(node_id, str) and node_id.isdecimal(): return (0, int(node_id))
+        return (1, str(node_id))
 
     sorted_nodes = sorted(nodes, key=lambda n: (
-        NODE_CATEGORIES_ORDER.index(NODE_CATEGORIES.get(n.get('type'), 'others')),
+        _CATEGORY_RANK[NODE_CATEGORIES.get(n.get('type'), 'others')],
         get_id_safe(n)
     ))
     
     summary_list = []
-    
-    valid_media_exts = {
-        '.png', '.jpg', '.jpeg', '.webp', '.gif', '.jfif', '.bmp', '.tiff',
-        '.mp4', '.mov', '.webm', '.mkv', '.avi',
-        '.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac'
-    }
-
-    base_input_norm = os.path.normpath(BASE_INPUT_PATH)
+    input_index = None
 
     for node in sorted_nodes:
         node_type = node.get('type', 'Unknown')
         params_list = []
-        
-        raw_params = {}
-        if is_api_format:
-            raw_params = node.get('inputs', {})
-        else:
-            widgets_values = node.get('widgets_values', [])
-            param_names_list = NODE_PARAM_NAMES.get(node_type, [])
-            for i, value in enumerate(widgets_values):
-                name = param_names_list[i] if i < len(param_names_list) else f"param_{i+1}"
-                raw_params[name] = value
+        raw_params = _get_node_params(node, node_type, is_api_format)
 
         for name, value in raw_params.items():
             display_value = value
@@ -474,38 +613,25 @@ def generate_node_summary(workflow_json_string):
                 else:
                      display_value = str(value)
             
-            if isinstance(value, str) and value.strip():
-                # 1. Pulizia aggressiva per rimuovere suffissi tipo " [output]" o " [input]"
-                clean_value = value.replace('\\', '/').strip()
-                # Rimuovi suffissi comuni tra parentesi quadre alla fine della stringa
-                clean_value = re.sub(r'\s*\[.*?\]$', '', clean_value)
+            clean_value = _clean_media_reference(value)
+            if clean_value:
+                filename_only = os.path.basename(clean_value)
                 
-                _, ext = os.path.splitext(clean_value)
-                
-                if ext.lower() in valid_media_exts:
-                    filename_only = os.path.basename(clean_value)
-                    
-                    candidates = [
-                        os.path.join(BASE_INPUT_PATH, clean_value),
-                        os.path.join(BASE_INPUT_PATH, filename_only),
-                        os.path.normpath(os.path.join(BASE_INPUT_PATH, clean_value))
-                    ]
-
-                    for candidate_path in candidates:
-                        try:
-                            if os.path.isfile(candidate_path):
-                                abs_candidate = os.path.abspath(candidate_path)
-                                abs_base = os.path.abspath(BASE_INPUT_PATH)
-                                
-                                if abs_candidate.startswith(abs_base):
-                                    is_input_file = True
-                                    rel_path = os.path.relpath(abs_candidate, abs_base).replace('\\', '/')
-                                    input_url = f"/galleryout/input_file/{rel_path}"
-                                    # Aggiorniamo anche il valore mostrato a video per pulirlo
-                                    display_value = clean_value 
-                                    break 
-                        except Exception:
-                            continue
+                if input_index is None:
+                    input_index = get_input_file_index()
+
+                # The reference as given, then just its file name at the input root
+                for candidate in (clean_value, filename_only):
+                    abs_candidate = resolve_input_path(candidate)
+                    if not abs_candidate:
+                        continue
+                    rel_path = input_index.get(os.path.normcase(os.path.relpath(abs_candidate, BASE_INPUT_ABSPATH)))
+                    if rel_path:
+                        is_input_file = True
+                        input_url = f"/galleryout/input_file/{rel_path}"
+                        # Aggiorniamo anche il valore mostrato a video per pulirlo
+                        display_value = clean_value
+                        break
 
             params_list.append({
                 "name": name, 
@@ -524,90 +650,60 @@ def generate_node_summary(workflow_json_string):
         
     return summary_list
 
-def extract_models_and_loras(workflow_json_string):
+def _model_file_name(value):
+    """File name part of a model/LoRA parameter, handling both path separators."""
+    if value and isinstance(value, str) and value.strip():
+        return os.path.basename(value.replace('\\', '/')).strip() or None
+    return None
+
+def analyze_workflow(workflow_json_string):
     """
-    Extracts checkpoint model names and LoRA names from a workflow JSON.
-    Returns a tuple of (models_list, loras_list) with deduplicated, sorted entries.
+    Parses a workflow JSON once and walks its active nodes in a single pass.
+    Returns a tuple of (models_list, loras_list, input_files_list) with
+    deduplicated, sorted entries; empty lists if the JSON can't be parsed.
     """
     models = set()
     loras = set()
-
-    # Node types that contain model/checkpoint names
-    CHECKPOINT_NODES = {
-        "CheckpointLoaderSimple": ["ckpt_name"],
-        "Load Checkpoint": ["ckpt_name"],
-        "CheckpointLoader": ["ckpt_name"],
-        "ModelMerger": ["ckpt_name1", "ckpt_name2"],
-        "UNETLoader": ["unet_name"],
-        "DiffusersLoader": ["model_path"],
-    }
-
-    # Node types that contain LoRA names
-    LORA_NODES = {
-        "LoraLoader": ["lora_name"],
-        "LoraLoaderModelOnly": ["lora_name"],
-        "Load LoRA": ["lora_name"],
-        "Lora Loader": ["lora_name"],
-        "LoRALoader": ["lora_name"],
-        "LoraLoaderBlockWeight": ["lora_name"],
-    }
+    input_files = set()
 
     try:
-        workflow_data = json.loads(workflow_json_string)
+        nodes, is_api_format = parse_workflow_nodes(workflow_json_string)
     except (json.JSONDecodeError, TypeError):
-        return ([], [])
-
-    nodes = []
-    is_api_format = False
-
-    # Handle UI format (has 'nodes' array)
-    if 'nodes' in workflow_data and isinstance(workflow_data['nodes'], list):
-        active_workflow = filter_enabled_nodes(workflow_data)
-        nodes = active_workflow.get('nodes', [])
-    else:
-        # API format (dict of node_id -> node_data)
-        is_api_format = True
-        for node_id, node_data in workflow_data.items():
-            if isinstance(node_data, dict) and 'class_type' in node_data:
-                node_entry = node_data.copy()
-                node_entry['type'] = node_data['class_type']
-                nodes.append(node_entry)
+        return ([], [], [])
 
     for node in nodes:
         node_type = node.get('type', node.get('class_type', ''))
+        raw_params = _get_node_params(node, node_type, is_api_format)
 
-        # Get inputs based on format
-        if is_api_format:
-            inputs = node.get('inputs', {})
-        else:
-            # UI format - need to map widgets_values to param names
-            widgets_values = node.get('widgets_values', [])
-            param_names = CHECKPOINT_NODES.get(node_type, []) or LORA_NODES.get(node_type, [])
-            inputs = {}
-            for i, value in enumerate(widgets_values):
-                if i < len(param_names):
-                    inputs[param_names[i]] = value
-
-        # Extract checkpoint models
-        if node_type in CHECKPOINT_NODES:
-            for param in CHECKPOINT_NODES[node_type]:
-                value = inputs.get(param)
-                if value and isinstance(value, str) and value.strip():
-                    # Get just the filename, handling path separators
-                    model_name = value.replace('\\', '/').split('/')[-1].strip()
-                    if model_name:
-                        models.add(model_name)
-
-        # Extract LoRAs
-        if node_type in LORA_NODES:
-            for param in LORA_NODES[node_type]:
-                value = inputs.get(param)
-                if value and isinstance(value, str) and value.strip():
-                    lora_name = value.replace('\\', '/').split('/')[-1].strip()
-                    if lora_name:
-                        loras.add(lora_name)
-
-    return (sorted(list(models)), sorted(list(loras)))
+        # Checkpoints and LoRAs. UI widgets are named after the loader's own parameter list.
+        rules = _EXTRACT_RULES.get(node_type)
+        if rules:
+            if is_api_format:
+                values = [raw_params.get(param) for _, param in rules]
+            else:
+                values = node.get('widgets_values', [])
+            for (bucket, _), value in zip(rules, values):
+                name = _model_file_name(value)
+                if name:
+                    (models if bucket == 'model' else loras).add(name)
+
+        # Scan all string parameters for media file references
+        for value in raw_params.values():
+            clean_value = _clean_media_reference(value)
+            if clean_value:
+                filename = os.path.basename(clean_value)
+                if filename:
+                    input_files.add(filename)
+
+    return (sorted(models), sorted(loras), sorted(input_files))
+
+def extract_models_and_loras(workflow_json_string):
+    """
+    Extracts checkpoint model names and LoRA names from a workflow JSON.
+    Returns a tuple of (models_list, loras_list) with deduplicated, sorted entries.
+    """
+    models_list, loras_list, _ = analyze_workflow(workflow_json_string)
+    return (models_list, loras_list)
 
 def extract_input_files_from_workflow(workflow_json_string):
     """
@@ -615,67 +711,7 @@ def extract_input_files_from_workflow(workflow_json_string):
     Scans ALL parameters from ALL nodes for media file references.
     Returns list of unique input file names.
     """
-    input_files = set()
-
-    # Valid media extensions to look for
-    valid_media_exts = {
-        '.png', '.jpg', '.jpeg', '.webp', '.gif', '.jfif', '.bmp', '.tiff',
-        '.mp4', '.mov', '.webm', '.mkv', '.avi',
-        '.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac'
-    }
-
-    try:
-        workflow_data = json.loads(workflow_json_string)
-    except (json.JSONDecodeError, TypeError):
-        return []
-
-    nodes = []
-    is_api_format = False
-
-    # Handle UI format (has 'nodes' array)
-    if 'nodes' in workflow_data and isinstance(workflow_data['nodes'], list):
-        active_workflow = filter_enabled_nodes(workflow_data)
-        nodes = active_workflow.get('nodes', [])
-    else:
-        # API format (dict of node_id -> node_data)
-        is_api_format = True
-        for node_id, node_data in workflow_data.items():
-            if isinstance(node_data, dict) and 'class_type' in node_data:
-                node_entry = node_data.copy()
-                node_entry['type'] = node_data['class_type']
-                node_entry['inputs'] = node_data.get('inputs', {})
-                nodes.append(node_entry)
-
-    for node in nodes:
-        node_type = node.get('type', node.get('class_type', ''))
-
-        # Get all parameters based on format
-        raw_params = {}
-        if is_api_format:
-            raw_params = node.get('inputs', {})
-        else:
-            # UI format - get from widgets_values
-            widgets_values = node.get('widgets_values', [])
-            param_names_list = NODE_PARAM_NAMES.get(node_type, [])
-            for i, value in enumerate(widgets_values):
-                name = param_names_list[i] if i < len(param_names_list) else f"param_{i+1}"
-                raw_params[name] = value
-
-        # Scan all string parameters for media file references
-        for name, value in raw_params.items():
-            if isinstance(value, str) and value.strip():
-                # Clean up value (remove [output] suffixes, normalize path)
-                clean_value = value.replace('\\', '/').strip()
-                clean_value = re.sub(r'\s*\[.*?\]$', '', clean_value)
-
-                _, ext = os.path.splitext(clean_value)
-
-                if ext.lower() in valid_media_exts:
-                    filename = os.path.basename(clean_value)
-                    if filename:
-                        input_files.add(filename)
-
-    return sorted(list(input_files))
+    return analyze_workflow(workflow_json_string)[2]
 
 # --- ALL UTILITY AND HELPER FUNCTIONS ARE DEFINED HERE, BEFORE ANY ROUTES ---
 
@@ -711,37 +747,88 @@ def safe_delete_file(filepath):
         # Permanently delete
         os.remove(filepath)
 
-def find_ffprobe_path():
-    if FFPROBE_MANUAL_PATH and os.path.isfile(FFPROBE_MANUAL_PATH):
+def _find_media_tool(manual_path, name):
+    """
+    Returns an absolute path to a working ffmpeg-family executable, or None.
+    Tries the configured path first, then resolves name on PATH once with shutil.which(),
+    so later subprocess calls don't repeat the PATH search for every file.
+    """
+    candidates = []
+    if manual_path and os.path.isfile(manual_path):
+        candidates.append(manual_path)
+    on_path = shutil.which(name + ".exe" if sys.platform == "win32" else name)
+    if on_path:
+        candidates.append(os.path.abspath(on_path))
+    for candidate in dict.fromkeys(candidates):
         try:
-            subprocess.run([FFPROBE_MANUAL_PATH, "-version"], capture_output=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-            return FFPROBE_MANUAL_PATH
+            subprocess.run([candidate, "-version"], capture_output=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+            return candidate
         except Exception: pass
-    base_name = "ffprobe.exe" if sys.platform == "win32" else "ffprobe"
-    try:
-        subprocess.run([base_name, "-version"], capture_output=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-        return base_name
-    except Exception: pass
-    print("WARNING: ffprobe not found. Video metadata analysis will be disabled.")
     return None
 
+@functools.lru_cache(maxsize=None)
+def find_ffprobe_path():
+    """
+    Finds the ffprobe executable path. Cached, so callers that fall back to it when
+    FFPROBE_EXECUTABLE_PATH is empty don't re-run the '-version' probe (or repeat the
+    warning) for every file when ffprobe is missing.
+    """
+    ffprobe_path = _find_media_tool(FFPROBE_MANUAL_PATH, "ffprobe")
+    if not ffprobe_path:
+        print("WARNING: ffprobe not found. Video metadata analysis will be disabled.")
+    return ffprobe_path
+
+_ffmpeg_path = None
+
 def find_ffmpeg_path():
-    """Finds the ffmpeg executable path for video concatenation."""
-    if FFMPEG_MANUAL_PATH and os.path.isfile(FFMPEG_MANUAL_PATH):
-        try:
-            subprocess.run([FFMPEG_MANUAL_PATH, "-version"], capture_output=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-            return FFMPEG_MANUAL_PATH
-        except Exception: pass
-    base_name = "ffmpeg.exe" if sys.platform == "win32" else "ffmpeg"
+    """
+    Finds the ffmpeg executable path for video concatenation.
+    A found path is cached for the life of the process; a miss is not, so ffmpeg
+    installed while the gallery is running is picked up without a restart.
+    """
+    global _ffmpeg_path
+    if _ffmpeg_path is None:
+        _ffmpeg_path = _find_media_tool(FFMPEG_MANUAL_PATH, "ffmpeg")
+    return _ffmpeg_path
+
+@functools.lru_cache(maxsize=None)
+def get_ffmpeg_version(ffmpeg_path):
+    """
+    Returns the (major, minor) version reported by 'ffmpeg -version', or None for
+    git snapshot builds and anything else that does not carry a release number.
+    """
     try:
-        subprocess.run([base_name, "-version"], capture_output=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-        return base_name
-    except Exception: pass
-    return None
+        result = subprocess.run([ffmpeg_path, "-version"], capture_output=True, text=True, errors='ignore', check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+    except Exception:
+        return None
+    match = re.match(r'ffmpeg version n?(\d+)\.(\d+)', result.stdout)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+# Recent _validate_and_get_workflow() results by content digest. The same JSON is often
+# met twice for one file (a metadata chunk, then again by the raw byte scan). Kept small
+# because entries hold whole workflows.
+_WORKFLOW_VALIDATION_CACHE_SIZE = 32
+_workflow_validation_cache = {}
+# Shared by the request and sync threads; parsing happens outside the lock
+_workflow_validation_lock = threading.Lock()
 
 def _validate_and_get_workflow(json_string):
+    if not isinstance(json_string, str):
+        return _parse_workflow_candidate(json_string)
+    key = hashlib.blake2b(json_string.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _workflow_validation_lock:
+        result = _workflow_validation_cache.get(key)
+    if result is None:
+        result = _parse_workflow_candidate(json_string)
+        with _workflow_validation_lock:
+            if key not in _workflow_validation_cache and len(_workflow_validation_cache) >= _WORKFLOW_VALIDATION_CACHE_SIZE:
+                _workflow_validation_cache.pop(next(iter(_workflow_validation_cache)), None)
+            _workflow_validation_cache[key] = result
+    return result
+
+def _parse_workflow_candidate(json_string):
     try:
-        data = json.loads(json_string)
+        data = parse_workflow_json(json_string)
 
         # Try to get workflow data, handling nested string JSON
         workflow_data = None
@@ -751,7 +838,7 @@ def _validate_and_get_workflow(json_string):
             wf = data['workflow']
             if isinstance(wf, str):
                 try:
-                    wf = json.loads(wf)
+                    wf = parse_workflow_json(wf)
                 except:
                     pass
             if isinstance(wf, dict):
@@ -762,7 +849,7 @@ def _validate_and_get_workflow(json_string):
             prompt = data['prompt']
             if isinstance(prompt, str):
                 try:
-                    prompt = json.loads(prompt)
+                    prompt = parse_workflow_json(prompt)
                 except:
                     pass
             if isinstance(prompt, dict):
@@ -791,49 +878,141 @@ def _validate_and_get_workflow(json_string):
 
     return None, None
 
-def _scan_bytes_for_workflow(content_bytes):
+_JSON_DECODER = json.JSONDecoder()
+# A workflow is a non-empty object, so candidates must open with a key
+_JSON_OBJECT_START_RE = re.compile(rb'\{\s*"')
+# Bytes decoded per candidate at first; doubled while the object runs past the window
+_SCAN_WINDOW_SIZE = 64 * 1024
+
+def _scan_bytes_for_workflow(content_bytes, start_pos=0):
     """
-    Generator that yields all valid JSON objects found in the byte stream.
-    Searches for matching curly braces.
+    Generator that yields all non-empty JSON objects found in a bytes-like buffer
+    (bytes or an mmap). Candidates are located in the raw bytes and only a window
+    from each one is decoded and handed to the C JSON decoder, which parses and
+    validates in one pass and understands strings, so braces inside prompt text
+    don't break it. Scanning begins at byte offset start_pos.
     """
-    try:
-        stream_str = content_bytes.decode('utf-8', errors='ignore')
-    except Exception:
-        return
-
-    start_pos = 0
+    size = len(content_bytes)
     while True:
-        first_brace = stream_str.find('{', start_pos)
-        if first_brace == -1:
+        match = _JSON_OBJECT_START_RE.search(content_bytes, start_pos)
+        if not match:
             break
-        
-        open_braces = 0
-        start_index = first_brace
-        
-        for i in range(start_index, len(stream_str)):
-            char = stream_str[i]
-            if char == '{':
-                open_braces += 1
-            elif char == '}':
-                open_braces -= 1
-            
-            if open_braces == 0:
-                candidate = stream_str[start_index : i + 1]
-                try:
-                    # Verify it's valid JSON
-                    json.loads(candidate)
-                    yield candidate
-                except json.JSONDecodeError:
-                    pass
-                
-                # Move start_pos to after this candidate to find the next one
-                start_pos = i + 1
+        first_brace = match.start()
+        window_size = _SCAN_WINDOW_SIZE
+        while True:
+            window_end = min(first_brace + window_size, size)
+            text = content_bytes[first_brace:window_end].decode('utf-8', errors='ignore')
+            try:
+                _, end = _JSON_DECODER.raw_decode(text)
                 break
-        else:
-            # If loop finishes without open_braces hitting 0, no more valid JSON here
-            break
+            except json.JSONDecodeError as e:
+                # An error at the very end of the window (or an open string) means the
+                # object may just be longer than the window
+                truncated = e.pos >= len(text) - 8 or e.msg.startswith('Unterminated string')
+                if window_end < size and truncated:
+                    window_size *= 2
+                    continue
+                end = None
+                break
+        if end is None:
+            # Not a complete JSON object, try the next candidate
+            start_pos = first_brace + 1
+            continue
+        yield text[:end]
+        # Continue after this object to find the next one
+        start_pos = first_brace + len(text[:end].encode('utf-8'))
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
 
-def extract_workflow(filepath):
+def _decompress_png_text(data):
+    """
+    Inflates a zTXt/iTXt payload up to PIL's MAX_TEXT_CHUNK limit, like PIL's own
+    reader, so a decompression bomb in an uploaded PNG cannot exhaust memory.
+    Returns None if the text is larger than the limit.
+    """
+    decompressor = zlib.decompressobj()
+    text = decompressor.decompress(data, PngImagePlugin.MAX_TEXT_CHUNK)
+    if decompressor.unconsumed_tail:
+        return None
+    return text
+
+def _read_png_text(filepath):
+    """
+    Reads the text chunks (tEXt/zTXt/iTXt) and eXIf chunk of a PNG without
+    decoding the image: every other chunk is skipped with seek(), and reading
+    stops at the first IDAT, which is also where PIL stops collecting metadata.
+    Returns a dict shaped like PIL's img.info, or None if the file is not a PNG.
+    """
+    info = {}
+    try:
+        with open(filepath, 'rb') as f:
+            if f.read(8) != _PNG_SIGNATURE:
+                return None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    break
+                length = int.from_bytes(header[:4], 'big')
+                chunk_type = header[4:]
+                if chunk_type in (b'IDAT', b'IEND'):
+                    break
+                if chunk_type not in (b'tEXt', b'zTXt', b'iTXt', b'eXIf'):
+                    f.seek(length + 4, 1)  # chunk data + CRC
+                    continue
+                data = f.read(length)
+                f.seek(4, 1)  # CRC
+                try:
+                    if chunk_type == b'eXIf':
+                        info['exif'] = b'Exif\x00\x00' + data
+                        continue
+                    keyword, _, value = data.partition(b'\x00')
+                    if chunk_type == b'tEXt':
+                        text = value.decode('latin-1')
+                    elif chunk_type == b'zTXt':
+                        text = _decompress_png_text(value[1:])
+                        if text is None:
+                            continue
+                        text = text.decode('latin-1')
+                    else:
+                        # iTXt: compression flag, method, language tag, translated keyword, text
+                        compressed = value[0]
+                        _, _, value = value[2:].partition(b'\x00')
+                        _, _, value = value.partition(b'\x00')
+                        if compressed:
+                            value = _decompress_png_text(value)
+                            if value is None:
+                                continue
+                        text = value.decode('utf-8')
+                    info[keyword.decode('latin-1')] = text
+                except (IndexError, UnicodeDecodeError, zlib.error):
+                    continue
+    except OSError:
+        return None
+    return info
+
+def probe_video(filepath):
+    """
+    Runs ffprobe once on a video and returns its parsed JSON output (the container
+    format with its tags and duration, plus the streams), or None if ffprobe is
+    unavailable or fails.
+    """
+    # The global is empty in worker processes started before the path was found
+    ffprobe_path = FFPROBE_EXECUTABLE_PATH or find_ffprobe_path()
+    if not ffprobe_path:
+        return None
+    try:
+        cmd = [ffprobe_path, '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_streams', filepath]
+        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+        return json.loads(result.stdout)
+    except Exception:
+        return None
+
+def extract_workflow(filepath, probe_data=None):
+    """
+    Returns the best workflow JSON embedded in a file (UI format preferred over API).
+    probe_data is an optional probe_video() result, so callers that already probed
+    a video don't run ffprobe again.
+    """
     ext = os.path.splitext(filepath)[1].lower()
     video_exts = ['.mp4', '.mkv', '.webm', '.mov', '.avi']
     
@@ -849,69 +1028,62 @@ def extract_workflow(filepath):
         return False
 
     if ext in video_exts:
-        # --- FIX: Risoluzione del path anche nei processi Worker ---
-        # Se la variabile globale è vuota (succede nel multiprocessing), la cerchiamo ora.
-        current_ffprobe_path = FFPROBE_EXECUTABLE_PATH
-        if not current_ffprobe_path:
-             current_ffprobe_path = find_ffprobe_path()
-        # -----------------------------------------------------------
-
-        if current_ffprobe_path:
-            try:
-                # Usiamo current_ffprobe_path invece della globale
-                cmd = [current_ffprobe_path, '-v', 'quiet', '-print_format', 'json', '-show_format', filepath]
-                result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', check=True, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-                data = json.loads(result.stdout)
-                if 'format' in data and 'tags' in data['format']:
-                    for value in data['format']['tags'].values():
-                        if isinstance(value, str) and value.strip().startswith('{'):
-                            wf, wf_type = _validate_and_get_workflow(value)
-                            if wf:
-                                if update_best(wf, wf_type): return best_workflow
-            except Exception: pass
-    else:
+        data = probe_data if probe_data is not None else probe_video(filepath)
         try:
-            with Image.open(filepath) as img:
-                # Check standard keys first
-                for key in ['workflow', 'prompt']:
-                    val = img.info.get(key)
-                    if val:
-                        wf, wf_type = _validate_and_get_workflow(val)
+            if data and 'format' in data and 'tags' in data['format']:
+                for value in data['format']['tags'].values():
+                    if isinstance(value, str) and value.strip().startswith('{'):
+                        wf, wf_type = _validate_and_get_workflow(value)
                         if wf:
                             if update_best(wf, wf_type): return best_workflow
-
-                exif_data = img.info.get('exif')
-                if exif_data and isinstance(exif_data, bytes):
-                    # Check for "workflow:" prefix which some tools use
-                    try:
-                        exif_str = exif_data.decode('utf-8', errors='ignore')
-                        if 'workflow:{' in exif_str:
-                            # Extract the JSON part after "workflow:"
-                            start = exif_str.find('workflow:{') + len('workflow:')
-                            # Try to parse this specific part first
-                            for json_candidate in _scan_bytes_for_workflow(exif_str[start:].encode('utf-8')):
-                                wf, wf_type = _validate_and_get_workflow(json_candidate)
-                                if wf:
-                                    if update_best(wf, wf_type): return best_workflow
-                                    break 
-                    except Exception: pass
-                    
-                    # Fallback to standard scan of the entire exif_data if not already returned
-                    if best_workflow is None:
-                        for json_str in _scan_bytes_for_workflow(exif_data):
-                            wf, wf_type = _validate_and_get_workflow(json_str)
+        except Exception: pass
+    else:
+        try:
+            # PNG metadata is read straight from the chunks; other formats go through PIL
+            info = _read_png_text(filepath) if ext == '.png' else None
+            if info is None:
+                with Image.open(filepath) as img:
+                    info = img.info
+
+            # Check standard keys first
+            for key in ['workflow', 'prompt']:
+                val = info.get(key)
+                if val:
+                    wf, wf_type = _validate_and_get_workflow(val)
+                    if wf:
+                        if update_best(wf, wf_type): return best_workflow
+
+            exif_data = info.get('exif')
+            if exif_data and isinstance(exif_data, bytes):
+                # Check for "workflow:" prefix which some tools use
+                try:
+                    # Located in the raw bytes; the scanner only decodes the candidate windows
+                    start = exif_data.find(b'workflow:{')
+                    if start != -1:
+                        # Try to parse the JSON part after "workflow:" first
+                        for json_candidate in _scan_bytes_for_workflow(exif_data, start + len(b'workflow:')):
+                            wf, wf_type = _validate_and_get_workflow(json_candidate)
                             if wf:
                                 if update_best(wf, wf_type): return best_workflow
+                                break 
+                except Exception: pass
+                
+                # Fallback to standard scan of the entire exif_data if not already returned
+                if best_workflow is None:
+                    for json_str in _scan_bytes_for_workflow(exif_data):
+                        wf, wf_type = _validate_and_get_workflow(json_str)
+                        if wf:
+                            if update_best(wf, wf_type): return best_workflow
         except Exception: pass
 
     # Raw byte scan (fallback for any file type)
     try:
-        with open(filepath, 'rb') as f:
-            content = f.read()
-        for json_str in _scan_bytes_for_workflow(content):
-            wf, wf_type = _validate_and_get_workflow(json_str)
-            if wf:
-                if update_best(wf, wf_type): return best_workflow
+        # Mapped rather than read, so large videos are paged in by the OS instead of copied into memory
+        with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            for json_str in _scan_bytes_for_workflow(content):
+                wf, wf_type = _validate_and_get_workflow(json_str)
+                if wf:
+                    if update_best(wf, wf_type): return best_workflow
     except Exception: pass
                 
     return best_workflow
@@ -926,7 +1098,16 @@ def format_duration(seconds):
     m, s = divmod(int(seconds), 60); h, m = divmod(m, 60)
     return f"{h}:{m:02d}:{s:02d}" if h > 0 else f"{m:02d}:{s:02d}"
 
-def extract_media_created_date(filepath, file_type):
+_DURATION_RE = re.compile(r'^(?:(\d+):)?(\d+):(\d+)$')
+
+def parse_duration_seconds(duration):
+    """Inverse of format_duration(): 'MM:SS' or 'H:MM:SS' to whole seconds (0 if unparseable)."""
+    match = _DURATION_RE.match(duration or '')
+    if not match: return 0
+    h, m, s = match.groups()
+    return int(h or 0) * 3600 + int(m) * 60 + int(s)
+
+def extract_media_created_date(filepath, file_type, probe_data=None):
     """
     Extract the original creation date from media files.
     For images: reads EXIF DateTimeOriginal or DateTimeDigitized
@@ -958,16 +1139,9 @@ def extract_media_created_date(filepath, file_type):
 
     # For videos, use ffprobe to get creation_time
     elif file_type == 'video':
-        current_ffprobe_path = FFPROBE_EXECUTABLE_PATH
-        if not current_ffprobe_path:
-            current_ffprobe_path = find_ffprobe_path()
-
-        if current_ffprobe_path:
+        data = probe_data if probe_data is not None else probe_video(filepath)
+        if data:
             try:
-                cmd = [current_ffprobe_path, '-v', 'quiet', '-print_format', 'json', '-show_format', filepath]
-                result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore', check=True,
-                                       creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
-                data = json.loads(result.stdout)
                 if 'format' in data and 'tags' in data['format']:
                     tags = data['format']['tags']
                     # Try common creation time tags
@@ -994,8 +1168,8 @@ def extract_media_created_date(filepath, file_type):
     return None
 
 
-def analyze_file_metadata(filepath):
-    details = {'type': 'unknown', 'duration': '', 'dimensions': '', 'has_workflow': 0, 'media_created_at': None}
+def analyze_file_metadata(filepath, read_workflow=True):
+    details = {'type': 'unknown', 'duration': '', 'duration_seconds': 0, 'dimensions': '', 'has_workflow': 0, 'workflow': None, 'media_created_at': None}
     ext_lower = os.path.splitext(filepath)[1].lower()
     type_map = {'.png': 'image', '.jpg': 'image', '.jpeg': 'image', '.gif': 'animated_image', '.mp4': 'video', '.webm': 'video', '.mov': 'video', '.mp3': 'audio', '.wav': 'audio', '.ogg': 'audio', '.flac': 'audio'}
     details['type'] = type_map.get(ext_lower, 'unknown')
@@ -1004,9 +1178,21 @@ def analyze_file_metadata(filepath):
         try:
             with Image.open(filepath) as img: details['dimensions'] = f"{img.width}x{img.height}"
         except Exception: pass
-    if extract_workflow(filepath): details['has_workflow'] = 1
+    # One ffprobe run serves the workflow tags, duration, dimensions and creation date
+    probe_data = (probe_video(filepath) or {}) if details['type'] == 'video' else None
+    # Kept in details so callers can reuse it instead of extracting the workflow a second time
+    if read_workflow:
+        details['workflow'] = extract_workflow(filepath, probe_data)
+    if details['workflow']: details['has_workflow'] = 1
     total_duration_sec = 0
     if details['type'] == 'video':
+        video_stream = next((st for st in probe_data.get('streams', []) if st.get('codec_type') == 'video'), {})
+        try: total_duration_sec = float(probe_data.get('format', {}).get('duration') or 0)
+        except (TypeError, ValueError): pass
+        if video_stream.get('width') and video_stream.get('height'):
+            details['dimensions'] = f"{video_stream['width']}x{video_stream['height']}"
+    if details['type'] == 'video' and (not details['dimensions'] or total_duration_sec <= 0):
+        # ffprobe missing or its output incomplete; read the container with OpenCV instead
         try:
             cap = cv2.VideoCapture(filepath)
             if cap.isOpened():
@@ -1022,11 +1208,69 @@ def analyze_file_metadata(filepath):
                     if ext_lower == '.gif': total_duration_sec = sum(frame.info.get('duration', 100) for frame in ImageSequence.Iterator(img)) / 1000
                     elif ext_lower == '.webp': total_duration_sec = getattr(img, 'n_frames', 1) / WEBP_ANIMATED_FPS
         except Exception: pass
-    if total_duration_sec > 0: details['duration'] = format_duration(total_duration_sec)
+    if total_duration_sec > 0:
+        details['duration'] = format_duration(total_duration_sec)
+        details['duration_seconds'] = int(total_duration_sec)
     # Extract original media creation date
-    details['media_created_at'] = extract_media_created_date(filepath, details['type'])
+    details['media_created_at'] = extract_media_created_date(filepath, details['type'], probe_data)
     return details
 
+# Browser cache lifetime for thumbnails (24 hours); ETags let expired copies revalidate with a 304
+THUMBNAIL_MAX_AGE = 86400
+
+_THUMBNAIL_MIMETYPES = {'.webp': 'image/webp', '.jpeg': 'image/jpeg', '.gif': 'image/gif'}
+
+def send_thumbnail(cache_path):
+    """Sends a cached thumbnail, handing it off to nginx when THUMBNAIL_ACCEL_REDIRECT_PREFIX is set."""
+    if THUMBNAIL_ACCEL_REDIRECT_PREFIX:
+        response = Response(mimetype=_THUMBNAIL_MIMETYPES.get(os.path.splitext(cache_path)[1], 'application/octet-stream'))
+        response.headers['X-Accel-Redirect'] = THUMBNAIL_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + os.path.basename(cache_path)
+        response.headers['Cache-Control'] = f'public, max-age={THUMBNAIL_MAX_AGE}'
+        return response
+    return send_file(cache_path, conditional=True, max_age=THUMBNAIL_MAX_AGE)
+
+@functools.lru_cache(maxsize=8192)
+def _thumbnail_hash(filepath, mtime):
+    """
+    Thumbnail cache key for a file version; memoized since (path, mtime) rarely changes between requests.
+    Uses 128-bit BLAKE2b, which is faster than MD5 in CPython; keep in sync with
+    cleanup_orphaned_thumbnails() in social/maintenance.py.
+    """
+    return hashlib.blake2b((filepath + str(mtime)).encode(), digest_size=16).hexdigest()
+
+def find_cached_thumbnail(file_hash, file_type=None):
+    """
+    Returns the path of an existing cached thumbnail for file_hash, or None.
+    create_thumbnail() only ever writes a few known extensions, so those paths are
+    probed directly instead of globbing a cache directory that can hold tens of
+    thousands of entries. Pass file_type when known to check only the likely ones.
+    """
+    static_ext = 'jpeg' if THUMBNAIL_FORMAT == 'jpeg' else 'webp'  # same choice as create_thumbnail()
+    if file_type in ('image', 'video'):
+        extensions = (static_ext,)
+    elif file_type == 'animated_image':
+        extensions = ('gif', 'webp', static_ext)
+    else:
+        extensions = (static_ext, 'gif', 'webp')
+    for ext in dict.fromkeys(extensions):
+        cache_path = os.path.join(THUMBNAIL_CACHE_DIR, f"{file_hash}.{ext}")
+        if os.path.exists(cache_path):
+            return cache_path
+    return None
+
+def _thumbnail_frames(img):
+    """
+    Yields each frame of an animated image shrunk to thumbnail size and converted to RGB.
+    Frames are copied one at a time, so only a single full-size frame is held in memory.
+    """
+    for frame in ImageSequence.Iterator(img):
+        frame = frame.copy()
+        frame.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 2), Image.Resampling.LANCZOS)
+        frame = frame.convert('RGB')
+        # A palette frame's transparent index would come through as a transparent RGB color
+        frame.info.pop('transparency', None)
+        yield frame
+
 def create_thumbnail(filepath, file_hash, file_type):
     """
     Create a thumbnail for an image or video file.
@@ -1045,17 +1289,13 @@ def create_thumbnail(filepath, file_hash, file_type):
                 if file_type == 'animated_image' and getattr(img, 'is_animated', False):
                     anim_fmt = 'gif' if img.format == 'GIF' else 'webp'
                     cache_path = os.path.join(THUMBNAIL_CACHE_DIR, f"{file_hash}.{anim_fmt}")
-                    frames = [fr.copy() for fr in ImageSequence.Iterator(img)]
-                    if frames:
-                        for frame in frames:
-                            frame.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 2), Image.Resampling.LANCZOS)
-                        processed_frames = [frame.convert('RGBA').convert('RGB') for frame in frames]
-                        if processed_frames:
-                            processed_frames[0].save(
-                                cache_path, save_all=True, append_images=processed_frames[1:],
-                                duration=img.info.get('duration', 100), loop=img.info.get('loop', 0),
-                                optimize=True, quality=thumb_quality if anim_fmt == 'webp' else None
-                            )
+                    processed_frames = list(_thumbnail_frames(img))
+                    if processed_frames:
+                        processed_frames[0].save(
+                            cache_path, save_all=True, append_images=processed_frames[1:],
+                            duration=img.info.get('duration', 100), loop=img.info.get('loop', 0),
+                            optimize=True, quality=thumb_quality if anim_fmt == 'webp' else None
+                        )
                     return cache_path
                 else:
                     # Static image thumbnail
@@ -1082,9 +1322,13 @@ def create_thumbnail(filepath, file_hash, file_type):
             cap.release()
             if success and frame is not None:
                 cache_path = os.path.join(THUMBNAIL_CACHE_DIR, f"{file_hash}.{thumb_ext}")
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame_rgb)
-                img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 2), Image.Resampling.LANCZOS)
+                # Shrink the decoded BGR frame with OpenCV's area filter before any conversion,
+                # fitting the same box as Image.thumbnail() and never enlarging
+                height, width = frame.shape[:2]
+                scale = min(THUMBNAIL_WIDTH / width, THUMBNAIL_WIDTH * 2 / height)
+                if scale < 1:
+                    frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+                img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
                 if thumb_fmt == 'webp':
                     img.save(cache_path, 'WEBP', quality=thumb_quality, method=4)
                 else:
@@ -1094,47 +1338,199 @@ def create_thumbnail(filepath, file_hash, file_type):
             print(f"ERROR (OpenCV): Could not create thumbnail for {os.path.basename(filepath)}: {e}")
     return None
 
-def process_single_file(filepath):
+# Striped locks so concurrent requests that miss the same thumbnail only generate it once
+_thumbnail_locks = [threading.Lock() for _ in range(64)]
+
+def ensure_thumbnail(filepath, file_hash, file_type):
+    """Returns the cached thumbnail for file_hash, creating it first if it does not exist yet."""
+    cache_path = find_cached_thumbnail(file_hash, file_type)
+    if cache_path:
+        return cache_path
+    with _thumbnail_locks[hash(file_hash) % len(_thumbnail_locks)]:
+        # Another request may have finished generating it while we waited
+        cache_path = find_cached_thumbnail(file_hash, file_type)
+        if cache_path:
+            return cache_path
+        return create_thumbnail(filepath, file_hash, file_type)
+
+def process_single_file(filepath, stored_workflow=None):
     """
     Worker function to perform all heavy processing for a single file.
     Designed to be run in a parallel process pool.
+    stored_workflow is the (size, has_workflow, models, loras, input_files) of the file's
+    existing row: if the size is unchanged only the mtime moved (a touch or a copy), so
+    the stored workflow fields are reused instead of extracting and parsing it again.
     """
     try:
         mtime = os.path.getmtime(filepath)
-        metadata = analyze_file_metadata(filepath)
-        file_hash_for_thumbnail = hashlib.md5((filepath + str(mtime)).encode()).hexdigest()
+        file_size = os.path.getsize(filepath)
+        reuse_workflow = stored_workflow is not None and stored_workflow[0] == file_size
+        metadata = analyze_file_metadata(filepath, read_workflow=not reuse_workflow)
+        file_hash_for_thumbnail = _thumbnail_hash(filepath, mtime)
 
-        if not glob.glob(os.path.join(THUMBNAIL_CACHE_DIR, f"{file_hash_for_thumbnail}.*")):
+        if not find_cached_thumbnail(file_hash_for_thumbnail, metadata['type']):
             create_thumbnail(filepath, file_hash_for_thumbnail, metadata['type'])
 
         # Extract models, LoRAs, and input files from workflow if present
         models_list = []
         loras_list = []
         input_files_list = []
-        if metadata['has_workflow']:
-            workflow_json = extract_workflow(filepath)
-            if workflow_json:
-                models_list, loras_list = extract_models_and_loras(workflow_json)
-                input_files_list = extract_input_files_from_workflow(workflow_json)
+        workflow_json = metadata['workflow']
+        if workflow_json:
+            models_list, loras_list, input_files_list = analyze_workflow(workflow_json)
 
         file_id = hashlib.md5(filepath.encode()).hexdigest()
-        file_size = os.path.getsize(filepath)
+
+        if reuse_workflow:
+            has_workflow, models_json, loras_json, input_files_json = stored_workflow[1:]
+        else:
+            has_workflow = metadata['has_workflow']
+            models_json, loras_json, input_files_json = json.dumps(models_list), json.dumps(loras_list), json.dumps(input_files_list)
 
         return (
             file_id, filepath, mtime, os.path.basename(filepath),
-            metadata['type'], metadata['duration'], metadata['dimensions'], metadata['has_workflow'], file_size, time.time(),
-            json.dumps(models_list), json.dumps(loras_list), json.dumps(input_files_list),
-            metadata['media_created_at']
+            metadata['type'], metadata['duration'], metadata['dimensions'], has_workflow, file_size, time.time(),
+            models_json, loras_json, input_files_json,
+            metadata['media_created_at'], metadata['duration_seconds']
         )
     except Exception as e:
         print(f"ERROR: Failed to process file {os.path.basename(filepath)} in worker: {e}")
         return None
 
+# Column order matches the tuples returned by process_single_file()
+FILES_UPSERT_SQL = (
+    "INSERT OR REPLACE INTO files (id, path, mtime, name, type, duration, dimensions, has_workflow, size, last_scanned, "
+    "models, loras, input_files, media_created_at, duration_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Rows written per multi-row upsert statement (also capped by SQLite's bound-parameter limit)
+UPSERT_ROWS_PER_STATEMENT = 200
+
+@functools.lru_cache(maxsize=None)
+def _files_upsert_sql(row_count):
+    """FILES_UPSERT_SQL with row_count rows of placeholders in its VALUES clause."""
+    head, row = FILES_UPSERT_SQL.rsplit(' VALUES ', 1)
+    return f"{head} VALUES {', '.join([row] * row_count)}"
+
+def upsert_files(conn, rows):
+    """
+    Writes process_single_file() rows with multi-row INSERT OR REPLACE statements, so
+    SQLite runs one statement per few hundred rows instead of one per row as with executemany().
+    """
+    if not rows:
+        return
+    try:
+        max_variables = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    except AttributeError:  # Python < 3.11; SQLite's historical default
+        max_variables = 999
+    rows_per_statement = max(1, min(UPSERT_ROWS_PER_STATEMENT, max_variables // len(rows[0])))
+    for i in range(0, len(rows), rows_per_statement):
+        chunk = rows[i:i + rows_per_statement]
+        conn.execute(_files_upsert_sql(len(chunk)), list(itertools.chain.from_iterable(chunk)))
+
 def get_db_connection():
+    """
+    Inside a request, returns the connection shared by the whole request: it is opened
+    on first use and closed by close_db_connection() at teardown, so a request that
+    queries several times opens and configures the database once. Background threads
+    and streamed responses, which run outside the request, get a connection of their own.
+    'with get_db_connection() as conn:' only commits or rolls back; it does not close.
+    """
+    if has_request_context():
+        if '_db_conn' not in g:
+            g._db_conn = _open_db_connection()
+        return g._db_conn
+    return _open_db_connection()
+
+def _open_db_connection():
     conn = sqlite3.connect(DATABASE_FILE)
     conn.row_factory = sqlite3.Row
+    # Per-connection settings; WAL mode is stored in the database file and set once by initialize_gallery().
+    # NORMAL is safe in WAL mode: a power loss can only drop the last commits, not corrupt the file.
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MB
+    # Reads map the database file instead of copying pages through read() calls
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    # Lock waits are already covered by sqlite3.connect()'s 5 second default timeout (busy_timeout)
     return conn
 
+@app.teardown_appcontext
+def close_db_connection(exception=None):
+    """Closes the request's shared connection, if get_db_connection() opened one."""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.close()
+
+def direct_files_condition(folder_path):
+    """
+    SQL condition and params selecting files directly inside folder_path (not in subfolders).
+    A binary range on path (served by its UNIQUE index) replaces LIKE, whose '_'/'%'
+    wildcards and ASCII case folding also matched other folders and needed a Python
+    dirname() post-filter; instr() then drops anything below a further separator.
+    """
+    prefix = os.path.join(folder_path, '')
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return "path >= ? AND path < ? AND instr(substr(path, ?), ?) = 0", [prefix, upper, len(prefix) + 1, os.sep]
+
+def _begin_immediate(conn):
+    """
+    Starts the write transaction explicitly with BEGIN IMMEDIATE, taking the write lock
+    before any work is done instead of upgrading a read lock halfway through a batch.
+    The caller still ends it with conn.commit(), or the connection context manager
+    rolls it back on an exception.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+
+def _create_listing_indexes(conn):
+    """
+    Indexes for listings that are not limited to one folder (folder listings use the path
+    index): the smash cut filter reads videos newest first straight from (type, mtime).
+    """
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_type_mtime ON files(type, mtime)')
+
+def _create_input_file_table(conn):
+    """
+    file_input_files holds one (input_file, file_id) row per entry of files.input_files,
+    so the smash cut input filters are indexed lookups instead of a json_each() over every
+    video. Triggers keep it in step with every insert, path/id rewrite and delete of files.
+    The AFTER INSERT trigger clears the id first because INSERT OR REPLACE does not fire
+    delete triggers.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_input_files (
+            input_file TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (input_file, file_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_file_input_files_file_id ON file_input_files(file_id)')
+    fill = (
+        "INSERT OR IGNORE INTO file_input_files (input_file, file_id) "
+        "SELECT value, NEW.id FROM json_each(CASE WHEN json_valid(NEW.input_files) THEN NEW.input_files ELSE '[]' END) "
+        "WHERE type = 'text';"
+    )
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_input_files_insert AFTER INSERT ON files
+        BEGIN
+            DELETE FROM file_input_files WHERE file_id = NEW.id;
+            {fill}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS files_input_files_update AFTER UPDATE OF id, input_files ON files
+        BEGIN
+            DELETE FROM file_input_files WHERE file_id = OLD.id;
+            {fill}
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS files_input_files_delete AFTER DELETE ON files
+        BEGIN
+            DELETE FROM file_input_files WHERE file_id = OLD.id;
+        END
+    ''')
+
 def init_db(conn=None):
     close_conn = False
     if conn is None:
@@ -1155,7 +1551,8 @@ def init_db(conn=None):
             sp_original_path TEXT,
             sp_sync_timestamp REAL,
             original_path TEXT,
-            media_created_at REAL
+            media_created_at REAL,
+            duration_seconds INTEGER DEFAULT 0
         )
     ''')
     # Create move history table
@@ -1173,14 +1570,120 @@ def init_db(conn=None):
     # Create index for efficient lookups
     conn.execute('CREATE INDEX IF NOT EXISTS idx_move_history_file_id ON file_move_history(file_id)')
     conn.execute('CREATE INDEX IF NOT EXISTS idx_files_sp_item_id ON files(sp_item_id)')
+    _create_listing_indexes(conn)
+    _create_input_file_table(conn)
     conn.commit()
     if close_conn: conn.close()
     
-def get_dynamic_folder_config(force_refresh=False):
-    global folder_config_cache
+def _folder_config_unchanged(config):
+    """
+    True while every folder in config still has the mtime recorded when it was scanned.
+    Creating, renaming or deleting a folder (or a file) changes its parent's mtime, so
+    one stat per known folder replaces listing the whole tree again.
+    """
+    for folder in config.values():
+        try:
+            if os.stat(folder['path']).st_mtime != folder['mtime']:
+                return False
+        except OSError:
+            return False
+    return True
+
+def get_dynamic_folder_config(force_refresh=False, revalidate=False):
+    """
+    Returns the cached folder tree, scanning it on first use or when force_refresh is set.
+    With revalidate, the cache is also rescanned if any folder's mtime has changed.
+    """
+    global folder_config_cache, folder_config_cache_time
     if folder_config_cache is not None and not force_refresh:
-        return folder_config_cache
+        if not revalidate or _folder_config_unchanged(folder_config_cache):
+            return folder_config_cache
+
+    requested_at = time.monotonic()
+    with folder_config_lock:
+        # Concurrent refreshes share one scan: if another request started a scan
+        # after this one was made, that result is fresh enough.
+        if folder_config_cache is not None and folder_config_cache_time >= requested_at:
+            return folder_config_cache
+        scan_started = time.monotonic()
+        dynamic_config = _scan_folder_config()
+        folder_config_cache = dynamic_config
+        # Stamped with the start of the scan: changes made while it ran may be missing
+        folder_config_cache_time = scan_started
+    return dynamic_config
+
+# Folders listed concurrently while scanning the output tree; listing is I/O latency bound
+FOLDER_SCAN_THREADS = 16
+
+def _walk_dir_entries(top, keep_dir=lambda entry: True):
+    """
+    os.walk() (top-down, symlinked folders listed but not descended into) that yields
+    (dirpath, dir_entries, filenames) with os.DirEntry objects for the subfolders, so
+    their mtimes come from DirEntry.stat() instead of a path lookup per folder.
+    Folders are listed by a thread pool, so on network shares many listings are in
+    flight at once; the results are still yielded in os.walk's order. keep_dir filters
+    the subfolders before they are listed; unreadable folders are skipped.
+    """
+    def list_dir(path):
+        try:
+            with os.scandir(path) as entries:
+                entries = list(entries)
+        except OSError:
+            return path, None
+        dir_entries, filenames = [], []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                filenames.append(entry.name)
+            elif keep_dir(entry):
+                dir_entries.append(entry)
+        return path, (dir_entries, filenames)
+
+    listings = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=FOLDER_SCAN_THREADS) as executor:
+        pending = {executor.submit(list_dir, top)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                path, listing = future.result()
+                if listing is None:
+                    continue
+                listings[path] = listing
+                pending.update(executor.submit(list_dir, entry.path) for entry in listing[0] if not entry.is_symlink())
+
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        if path not in listings:
+            continue
+        dir_entries, filenames = listings[path]
+        yield path, dir_entries, filenames
+        stack.extend(entry.path for entry in reversed(dir_entries) if not entry.is_symlink())
+
+def _list_file_mtimes(folder_path, extensions=None, excluded_extensions=()):
+    """
+    Maps the path of each file directly inside folder_path to its mtime from one os.scandir
+    pass: entry types come with the listing, so only the mtime costs a stat per file.
+    extensions keeps only those (lowercase) extensions, excluded_extensions drops some.
+    Raises OSError if the folder cannot be listed.
+    """
+    file_mtimes = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            ext = os.path.splitext(entry.name)[1].lower()
+            if (extensions is not None and ext not in extensions) or ext in excluded_extensions:
+                continue
+            try:
+                if entry.is_file():
+                    file_mtimes[entry.path] = entry.stat().st_mtime
+            except OSError:  # Removed since the listing
+                pass
+    return file_mtimes
 
+def _scan_folder_config():
     print("INFO: Refreshing folder configuration by scanning directory tree...")
 
     base_path_normalized = os.path.normpath(BASE_OUTPUT_PATH).replace('\\', '/')
@@ -1213,9 +1716,12 @@ def get_dynamic_folder_config(force_refresh=False):
         all_folders = {}
         folder_has_files = {}  # Track which folders have files
 
-        for dirpath, dirnames, filenames in os.walk(BASE_OUTPUT_PATH):
-            # Exclude system/cache folders and hidden folders (starting with .)
-            dirnames[:] = [d for d in dirnames if d not in [THUMBNAIL_CACHE_FOLDER_NAME, SQLITE_CACHE_FOLDER_NAME, ZIP_CACHE_FOLDER_NAME] and not d.startswith('.')]
+        # Exclude system/cache folders and hidden folders (starting with .)
+        excluded_folders = {THUMBNAIL_CACHE_FOLDER_NAME, SQLITE_CACHE_FOLDER_NAME, ZIP_CACHE_FOLDER_NAME}
+        def keep_dir(entry):
+            return entry.name not in excluded_folders and not entry.name.startswith('.')
+
+        for dirpath, dir_entries, filenames in _walk_dir_entries(BASE_OUTPUT_PATH, keep_dir):
 
             # Check if current directory has any valid media files
             rel_dir = os.path.relpath(dirpath, BASE_OUTPUT_PATH).replace('\\', '/')
@@ -1224,11 +1730,12 @@ def get_dynamic_folder_config(force_refresh=False):
             has_files = any(os.path.splitext(f)[1].lower() in valid_extensions for f in filenames)
             folder_has_files[rel_dir] = has_files
 
-            for dirname in dirnames:
-                full_path = os.path.normpath(os.path.join(dirpath, dirname)).replace('\\', '/')
+            for dir_entry in dir_entries:
+                dirname = dir_entry.name
+                full_path = os.path.normpath(dir_entry.path).replace('\\', '/')
                 relative_path = os.path.relpath(full_path, BASE_OUTPUT_PATH).replace('\\', '/')
                 try:
-                    mtime = os.path.getmtime(full_path)
+                    mtime = dir_entry.stat().st_mtime
                 except OSError:
                     mtime = time.time()
 
@@ -1267,15 +1774,85 @@ def get_dynamic_folder_config(force_refresh=False):
     except FileNotFoundError:
         print(f"WARNING: The base directory '{BASE_OUTPUT_PATH}' was not found.")
 
-    folder_config_cache = dynamic_config
-    return dynamic_config
-    
+    return dynamic_config
+
+def invalidate_folder_config():
+    """Drops the cached folder tree; the next get_dynamic_folder_config() call rescans it."""
+    global folder_config_cache, folder_config_cache_time
+    folder_config_cache = None
+    folder_config_cache_time = 0.0
+    
+def _init_worker(ffprobe_path, thumbnail_cache_dir):
+    """Pool worker initializer: adopts the parent's resolved settings instead of re-initializing."""
+    global FFPROBE_EXECUTABLE_PATH, THUMBNAIL_CACHE_DIR
+    FFPROBE_EXECUTABLE_PATH = ffprobe_path
+    THUMBNAIL_CACHE_DIR = thumbnail_cache_dir
+
+# Below this many files, handing them to the worker pool costs more than it saves
+PARALLEL_MIN_FILES = 8
+# Upper bound on files handed to a worker per round trip
+PARALLEL_MAX_CHUNKSIZE = 16
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+def _get_worker_pool():
+    """
+    Returns the worker pool (see WORKER_POOL_KIND) shared by every sync and rescan,
+    starting it on first use. Workers are started once instead of per call
+    (rescan_folder used to start a pool per batch), and the pool is created lazily so
+    a server that forks its workers after importing this module never inherits a pool
+    from its parent. A pool broken by a crashed worker is replaced.
+    """
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None or getattr(_worker_pool, '_broken', False):
+            max_workers = MAX_PARALLEL_WORKERS or os.cpu_count() or 1
+            if WORKER_POOL_KIND == 'thread':
+                # Threads share this process's settings, so they need no initializer
+                _worker_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            else:
+                _worker_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=max_workers, initializer=_init_worker,
+                    initargs=(FFPROBE_EXECUTABLE_PATH, THUMBNAIL_CACHE_DIR))
+        return _worker_pool
+
+def stored_workflow_fields(conn, paths):
+    """Maps each path with a files row to the stored_workflow tuple process_single_file() accepts."""
+    paths, fields = list(paths), {}
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        rows = conn.execute(
+            "SELECT path, size, has_workflow, models, loras, input_files FROM files "
+            f"WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+        fields.update((row[0], tuple(row)[1:]) for row in rows)
+    return fields
+
+def process_files(paths, stored_workflows=None):
+    """
+    Runs process_single_file() over paths, yielding (path, result) in order.
+    stored_workflows optionally maps paths to their stored_workflow_fields().
+    Small jobs are processed in this process without touching the pool at all.
+    Files go to the workers in chunks, which idle workers pull from a shared queue;
+    chunks stay small enough (about four per worker) that one slow video doesn't
+    leave the other workers waiting.
+    """
+    stored = [(stored_workflows or {}).get(path) for path in paths]
+    workers = min(MAX_PARALLEL_WORKERS or os.cpu_count() or 1, len(paths))
+    if workers <= 1 or len(paths) < PARALLEL_MIN_FILES:
+        for path, stored_workflow in zip(paths, stored):
+            yield path, process_single_file(path, stored_workflow)
+        return
+    chunksize = max(1, min(PARALLEL_MAX_CHUNKSIZE, len(paths) // (workers * 4)))
+    yield from zip(paths, _get_worker_pool().map(process_single_file, paths, stored, chunksize=chunksize))
+
 def full_sync_database(conn):
     print("INFO: Starting full file scan...")
     start_time = time.time()
 
     all_folders = get_dynamic_folder_config(force_refresh=True)
-    db_files = {row['path']: row['mtime'] for row in conn.execute('SELECT path, mtime FROM files').fetchall()}
+    # Stored mtimes arrive already truncated to whole seconds, the precision the change check uses
+    db_files = dict(conn.execute('SELECT path, CAST(mtime AS INTEGER) FROM files').fetchall())
     
     disk_files = {}
     print("INFO: Scanning directories on disk...")
@@ -1283,59 +1860,48 @@ def full_sync_database(conn):
         folder_path = folder_data['path']
         if not os.path.isdir(folder_path): continue
         try:
-            for name in os.listdir(folder_path):
-                filepath = os.path.join(folder_path, name)
-                if os.path.isfile(filepath) and os.path.splitext(name)[1].lower() not in ['.json', '.sqlite']:
-                    disk_files[filepath] = os.path.getmtime(filepath)
+            disk_files.update(_list_file_mtimes(folder_path, excluded_extensions=('.json', '.sqlite')))
         except OSError as e:
             print(f"WARNING: Could not access folder {folder_path}: {e}")
             
-    db_paths = set(db_files.keys())
-    disk_paths = set(disk_files.keys())
-    
-    to_delete = db_paths - disk_paths
-    to_add = disk_paths - db_paths
-    to_check = disk_paths & db_paths
-    to_update = {path for path in to_check if int(disk_files.get(path, 0)) > int(db_files.get(path, 0))}
+    to_delete = db_files.keys() - disk_files.keys()
+    to_add = disk_files.keys() - db_files.keys()
+    to_update = {path for path, mtime in disk_files.items() if path in db_files and int(mtime) > db_files[path]}
     
     files_to_process = list(to_add.union(to_update))
-    
+    results = []
+
     if files_to_process:
         print(f"INFO: Processing {len(files_to_process)} files in parallel using up to {MAX_PARALLEL_WORKERS or 'all'} CPU cores...")
         
-        results = []
         # --- CORRECT BLOCK FOR PROGRESS BAR ---
-        with concurrent.futures.ProcessPoolExecutor(max_workers=MAX_PARALLEL_WORKERS) as executor:
-            # Submit all jobs to the pool and get future objects
-            futures = {executor.submit(process_single_file, path): path for path in files_to_process}
-            
-            # Create the progress bar with the correct total
-            with tqdm(total=len(files_to_process), desc="Processing files") as pbar:
-                # Iterate over the jobs as they are COMPLETED
-                for future in concurrent.futures.as_completed(futures):
-                    result = future.result()
-                    if result:
-                        results.append(result)
-                    # Update the bar by 1 step for each completed job
-                    pbar.update(1)
-
+        # Create the progress bar with the correct total
+        with tqdm(total=len(files_to_process), desc="Processing files") as pbar:
+            # Iterate over the results as the workers return them
+            for _, result in process_files(files_to_process, stored_workflow_fields(conn, to_update)):
+                if result:
+                    results.append(result)
+                # Update the bar by 1 step for each completed job
+                pbar.update(1)
+
+    if results or to_delete:
+        # One transaction (and one sync to disk) for all upserts and deletes
+        _begin_immediate(conn)
         if results:
             print(f"INFO: Inserting {len(results)} processed records into the database...")
             for i in range(0, len(results), BATCH_SIZE):
                 batch = results[i:i + BATCH_SIZE]
-                conn.executemany(
-                    "INSERT OR REPLACE INTO files (id, path, mtime, name, type, duration, dimensions, has_workflow, size, last_scanned, models, loras, input_files, media_created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    batch
-                )
-                conn.commit()
-
-    if to_delete:
-        print(f"INFO: Removing {len(to_delete)} obsolete file entries from the database...")
-        conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in to_delete])
+                upsert_files(conn, batch)
+        if to_delete:
+            print(f"INFO: Removing {len(to_delete)} obsolete file entries from the database...")
+            conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in to_delete])
         conn.commit()
 
     print(f"INFO: Full scan completed in {time.time() - start_time:.2f} seconds.")
     
+# Upper bound on the per-file progress events sync_folder_on_demand() streams
+SYNC_PROGRESS_EVENTS = 100
+
 def sync_folder_on_demand(folder_path):
     yield f"data: {json.dumps({'message': 'Checking folder for changes...', 'current': 0, 'total': 1})}\n\n"
     
@@ -1343,18 +1909,14 @@ def sync_folder_on_demand(folder_path):
         with get_db_connection() as conn:
             disk_files, valid_extensions = {}, {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.mkv', '.webm', '.mov', '.avi', '.mp3', '.wav', '.ogg', '.flac'}
             if os.path.isdir(folder_path):
-                for name in os.listdir(folder_path):
-                    filepath = os.path.join(folder_path, name)
-                    if os.path.isfile(filepath) and os.path.splitext(name)[1].lower() in valid_extensions:
-                        disk_files[filepath] = os.path.getmtime(filepath)
+                disk_files = _list_file_mtimes(folder_path, extensions=valid_extensions)
             
-            db_files_query = conn.execute("SELECT path, mtime FROM files WHERE path LIKE ?", (folder_path + os.sep + '%',)).fetchall()
-            db_files = {row['path']: row['mtime'] for row in db_files_query if os.path.normpath(os.path.dirname(row['path'])) == os.path.normpath(folder_path)}
+            folder_condition, folder_params = direct_files_condition(folder_path)
+            db_files = dict(conn.execute(f"SELECT path, CAST(mtime AS INTEGER) FROM files WHERE {folder_condition}", folder_params).fetchall())
             
-            disk_filepaths, db_filepaths = set(disk_files.keys()), set(db_files.keys())
-            files_to_add = disk_filepaths - db_filepaths
-            files_to_delete = db_filepaths - disk_filepaths
-            files_to_update = {path for path in (disk_filepaths & db_filepaths) if int(disk_files[path]) > int(db_files[path])}
+            files_to_add = disk_files.keys() - db_files.keys()
+            files_to_delete = db_files.keys() - disk_files.keys()
+            files_to_update = {path for path, mtime in disk_files.items() if path in db_files and int(mtime) > db_files[path]}
             
             if not files_to_add and not files_to_update and not files_to_delete:
                 yield f"data: {json.dumps({'message': 'Folder is up-to-date.', 'status': 'no_changes', 'current': 1, 'total': 1})}\n\n"
@@ -1362,32 +1924,34 @@ def sync_folder_on_demand(folder_path):
 
             files_to_process = list(files_to_add.union(files_to_update))
             total_files = len(files_to_process)
-            
+            data_to_upsert = []
+
             if total_files > 0:
                 yield f"data: {json.dumps({'message': f'Found {total_files} new/modified files. Processing...', 'current': 0, 'total': total_files})}\n\n"
                 
-                data_to_upsert = []
                 processed_count = 0
+                # About SYNC_PROGRESS_EVENTS progress events per sync, however many files there are
+                progress_step = max(1, total_files // SYNC_PROGRESS_EVENTS)
 
-                with concurrent.futures.ProcessPoolExecutor(max_workers=MAX_PARALLEL_WORKERS) as executor:
-                    futures = {executor.submit(process_single_file, path): path for path in files_to_process}
+                stored_workflows = stored_workflow_fields(conn, files_to_update)
+                for path, result in process_files(files_to_process, stored_workflows):
+                    if result:
+                        data_to_upsert.append(result)
                     
-                    for future in concurrent.futures.as_completed(futures):
-                        result = future.result()
-                        if result:
-                            data_to_upsert.append(result)
-                        
-                        processed_count += 1
-                        path = futures[future]
-                        progress_data = {
-                            'message': f'Processing: {os.path.basename(path)}',
-                            'current': processed_count,
-                            'total': total_files
-                        }
-                        yield f"data: {json.dumps(progress_data)}\n\n"
-
-                if data_to_upsert:
-                    conn.executemany("INSERT OR REPLACE INTO files (id, path, mtime, name, type, duration, dimensions, has_workflow, size, last_scanned, models, loras, input_files, media_created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", data_to_upsert)
+                    processed_count += 1
+                    if processed_count % progress_step and processed_count != total_files:
+                        continue
+                    progress_data = {
+                        'message': f'Processing: {os.path.basename(path)}',
+                        'current': processed_count,
+                        'total': total_files
+                    }
+                    yield f"data: {json.dumps(progress_data)}\n\n"
+
+            # Upserts and deletes are written in one transaction
+            _begin_immediate(conn)
+            if data_to_upsert:
+                upsert_files(conn, data_to_upsert)
 
             if files_to_delete:
                 conn.executemany("DELETE FROM files WHERE path IN (?)", [(p,) for p in files_to_delete])
@@ -1400,13 +1964,24 @@ def sync_folder_on_demand(folder_path):
         print(f"ERROR: {error_message}")
         yield f"data: {json.dumps({'message': error_message, 'current': 1, 'total': 1, 'error': True})}\n\n"
         
+def sync_folder(folder_path):
+    """
+    Runs sync_folder_on_demand() to completion for callers that don't stream its progress.
+    It is a generator, so calling it without iterating would never run the sync.
+    """
+    for _ in sync_folder_on_demand(folder_path):
+        pass
+
 def scan_folder_and_extract_options(folder_path):
     extensions, prefixes = set(), set()
     file_count = 0
     try:
         if not os.path.isdir(folder_path): return 0, [], []
-        for filename in os.listdir(folder_path):
-            if os.path.isfile(os.path.join(folder_path, filename)):
+        with os.scandir(folder_path) as entries:
+            entries = list(entries)
+        for entry in entries:
+            filename = entry.name
+            if entry.is_file():
                 ext = os.path.splitext(filename)[1]
                 if ext and ext.lower() not in ['.json', '.sqlite']: 
                     extensions.add(ext.lstrip('.').lower())
@@ -1415,9 +1990,62 @@ def scan_folder_and_extract_options(folder_path):
     except Exception as e: print(f"ERROR: Could not scan folder '{folder_path}': {e}")
     return file_count, sorted(list(extensions)), sorted(list(prefixes))
 
+class TrashFolderError(Exception):
+    """DELETE_TO is set but cannot be used as a trash location."""
+    def __init__(self, message, hint):
+        super().__init__(message)
+        self.hint = hint
+
+def validate_delete_to():
+    """
+    Checks that DELETE_TO is usable and creates the trash folder inside it.
+    Called at startup rather than on import; raises TrashFolderError on failure.
+    """
+    global DELETE_TO, TRASH_FOLDER
+    if not DELETE_TO:
+        return
+
+    # Validate that DELETE_TO path exists. lstat() the path as given, before anything
+    # resolves it, so a symlink pointing the trash somewhere else is refused.
+    try:
+        st = os.lstat(DELETE_TO)
+    except OSError:
+        raise TrashFolderError(f"DELETE_TO path does not exist: {DELETE_TO}",
+                               "Please create the directory or unset the DELETE_TO environment variable.")
+    if stat.S_ISLNK(st.st_mode):
+        raise TrashFolderError(f"DELETE_TO path is a symbolic link: {DELETE_TO}",
+                               "Please point DELETE_TO at the real directory.")
+    DELETE_TO = os.path.realpath(DELETE_TO)
+    TRASH_FOLDER = os.path.join(DELETE_TO, 'SmartAssetGallery')
+
+    # Create the trash subfolder, or reuse it if it is already there
+    try:
+        os.makedirs(TRASH_FOLDER)
+        print(f"{Colors.GREEN}Created trash folder: {TRASH_FOLDER}{Colors.RESET}")
+    except FileExistsError:
+        if os.path.islink(TRASH_FOLDER):
+            raise TrashFolderError(f"Trash folder is a symbolic link: {TRASH_FOLDER}",
+                                   "Please replace it with a real directory.")
+    except OSError as e:
+        raise TrashFolderError(f"Cannot create trash folder: {TRASH_FOLDER}", f"Error: {e}") from e
+
+    # Validate that the trash folder is writable by actually creating a file in it
+    try:
+        with tempfile.TemporaryFile(dir=TRASH_FOLDER):
+            pass
+    except OSError:
+        raise TrashFolderError(f"DELETE_TO path is not writable: {TRASH_FOLDER}",
+                               "Please check permissions or unset the DELETE_TO environment variable.")
+
 def initialize_gallery():
     print("INFO: Initializing gallery...")
     global FFPROBE_EXECUTABLE_PATH, THUMBNAIL_CACHE_DIR, SQLITE_CACHE_DIR, DATABASE_FILE, ZIP_CACHE_DIR, SMASHCUT_OUTPUT_DIR
+    try:
+        validate_delete_to()
+    except TrashFolderError as e:
+        print(f"{Colors.RED}{Colors.BOLD}CRITICAL ERROR: {e}{Colors.RESET}")
+        print(f"{Colors.RED}{e.hint}{Colors.RESET}")
+        sys.exit(1)
     FFPROBE_EXECUTABLE_PATH = find_ffprobe_path()
 
     # Try to create cache directories, fall back to /tmp if permission denied
@@ -1437,6 +2065,11 @@ def initialize_gallery():
         os.makedirs(SQLITE_CACHE_DIR, exist_ok=True)
 
     with get_db_connection() as conn:
+        # Persistent: readers no longer block the sync's writes, and commits append to the WAL instead of rewriting pages
+        journal_mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        if journal_mode.lower() != 'wal':
+            # e.g. network filesystems without shared memory support
+            print(f"{Colors.YELLOW}WARNING: SQLite WAL mode unavailable, using journal_mode={journal_mode}{Colors.RESET}")
         try:
             # Check if last_scanned column exists
             cursor = conn.execute("PRAGMA table_info(files)")
@@ -1499,6 +2132,39 @@ def initialize_gallery():
                     conn.commit()
                     print("INFO: Migration to v28 complete (media creation date tracking).")
 
+            # Migration to version 29: Store parsed duration so queries don't re-parse the text
+            if stored_version < 29:
+                cursor = conn.execute("PRAGMA table_info(files)")
+                columns = [row[1] for row in cursor.fetchall()]
+
+                if 'duration_seconds' not in columns:
+                    print("INFO: Adding 'duration_seconds' column to files table...")
+                    conn.execute("ALTER TABLE files ADD COLUMN duration_seconds INTEGER DEFAULT 0")
+                    rows = conn.execute("SELECT id, duration FROM files WHERE duration IS NOT NULL AND duration != ''").fetchall()
+                    conn.executemany("UPDATE files SET duration_seconds = ? WHERE id = ?",
+                                     [(parse_duration_seconds(row['duration']), row['id']) for row in rows])
+                    conn.commit()
+                    print("INFO: Migration to v29 complete (numeric durations).")
+
+            # Migration to version 30: Index for the cross-folder video listing
+            if stored_version < 30:
+                _create_listing_indexes(conn)
+                conn.commit()
+                print("INFO: Migration to v30 complete (video listing index).")
+
+            # Migration to version 31: Input file references as indexed rows
+            if stored_version < 31:
+                _create_input_file_table(conn)
+                conn.execute("DELETE FROM file_input_files")
+                conn.execute(
+                    "INSERT OR IGNORE INTO file_input_files (input_file, file_id) "
+                    "SELECT je.value, files.id FROM files, "
+                    "json_each(CASE WHEN json_valid(files.input_files) THEN files.input_files ELSE '[]' END) AS je "
+                    "WHERE je.type = 'text'"
+                )
+                conn.commit()
+                print("INFO: Migration to v31 complete (input file index).")
+
             conn.execute(f'PRAGMA user_version = {DB_SCHEMA_VERSION}')
             conn.commit()
             print("INFO: Database migrations complete.")
@@ -1697,29 +2363,27 @@ def api_get_files(folder_key):
 
     folder_path = folders[folder_key]['path']
 
+    folder_condition, folder_params = direct_files_condition(folder_path)
     with get_db_connection() as conn:
-        query = """
+        query = f"""
             SELECT id, name, type, path, dimensions, size, mtime, is_favorite
             FROM files
-            WHERE path LIKE ?
+            WHERE {folder_condition}
             ORDER BY mtime DESC
         """
-        all_files_raw = conn.execute(query, (folder_path + os.sep + '%',)).fetchall()
+        all_files_raw = conn.execute(query, folder_params).fetchall()
 
-    # Filter to only files directly in this folder
-    folder_path_norm = os.path.normpath(folder_path)
     files = []
     for row in all_files_raw:
-        if os.path.normpath(os.path.dirname(row['path'])) == folder_path_norm:
-            files.append({
-                'id': row['id'],
-                'name': row['name'],
-                'type': row['type'],
-                'dimensions': row['dimensions'],
-                'size': row['size'],
-                'mtime': row['mtime'],
-                'is_favorite': bool(row['is_favorite'])
-            })
+        files.append({
+            'id': row['id'],
+            'name': row['name'],
+            'type': row['type'],
+            'dimensions': row['dimensions'],
+            'size': row['size'],
+            'mtime': row['mtime'],
+            'is_favorite': bool(row['is_favorite'])
+        })
 
     return jsonify({'files': files, 'count': len(files)})
 
@@ -1732,70 +2396,94 @@ def sync_status(folder_key):
     folder_path = folders[folder_key]['path']
     return Response(sync_folder_on_demand(folder_path), mimetype='text/event-stream')
 
+def _padded_in_list(values):
+    """
+    Placeholders and params for an IN list, padded with NULLs (which never match) to the
+    next power of two: a handful of distinct SQL texts cover every selection size, so
+    their prepared statements are reused from the connection's statement cache.
+    """
+    size = 1 << (len(values) - 1).bit_length()
+    return ', '.join('?' * size), list(values) + [None] * (size - len(values))
+
+def gallery_filter_query(folder_path, args):
+    """
+    WHERE clause, its params and the ORDER BY clause for a folder listing filtered by the
+    gallery's filter form (args), shared by gallery_view() and load_more() so each page
+    is read straight from SQLite. Ties are ordered by path so pages never overlap.
+    """
+    folder_condition, params = direct_files_condition(folder_path)
+    conditions = [folder_condition]
+
+    sort_by = 'name' if args.get('sort_by') == 'name' else 'mtime'
+    sort_order = 'asc' if args.get('sort_order', 'desc').lower() == 'asc' else 'desc'
+
+    search_term = args.get('search', '').strip()
+    if search_term:
+        conditions.append("name LIKE ?")
+        params.append(f"%{search_term}%")
+    if args.get('favorites', 'false').lower() == 'true':
+        conditions.append("is_favorite = 1")
+
+    # Media type filter
+    selected_media_types = args.getlist('media_type')
+    if selected_media_types:
+        type_conditions = []
+        for mt in selected_media_types:
+            if mt == 'image':
+                type_conditions.append("type IN ('image', 'animated_image')")
+            elif mt == 'video':
+                type_conditions.append("type = 'video'")
+            elif mt == 'audio':
+                type_conditions.append("type = 'audio'")
+            elif mt == 'document':
+                type_conditions.append("type = 'document'")
+        if type_conditions:
+            conditions.append(f"({' OR '.join(type_conditions)})")
+
+    # Prefix (text before the first '_') and extension (text after the last '.') are compared
+    # as one IN list each, so the SQL text depends only on the list's padded size
+    selected_prefixes = [p.strip().lower() for p in args.getlist('prefix') if p.strip()]
+    if selected_prefixes:
+        placeholders, values = _padded_in_list(selected_prefixes)
+        conditions.append(f"lower(substr(name, 1, instr(name, '_') - 1)) IN ({placeholders})")
+        params.extend(values)
+
+    selected_extensions = [ext.strip().lstrip('.').lower() for ext in args.getlist('extension') if ext.strip()]
+    if selected_extensions:
+        placeholders, values = _padded_in_list(selected_extensions)
+        conditions.append("instr(name, '.') > 0 AND "
+                          f"lower(substr(name, length(rtrim(name, replace(name, '.', ''))) + 1)) IN ({placeholders})")
+        params.extend(values)
+
+    # Filter by programs and campaigns; the social tables live in the same database file
+    if SOCIAL_FEATURES_ENABLED:
+        for table, column, selected in (('file_programs', 'program_id', args.getlist('program')),
+                                        ('file_campaigns', 'campaign_id', args.getlist('campaign'))):
+            if selected:
+                placeholders = ','.join('?' * len(selected))
+                conditions.append(f"id IN (SELECT file_id FROM {table} WHERE {column} IN ({placeholders}))")
+                params.extend(selected)
+
+    sort_direction = "ASC" if sort_order == 'asc' else "DESC"
+    return ' AND '.join(conditions), params, f"{sort_by} {sort_direction}, path {sort_direction}"
+
 @app.route('/galleryout/view/<string:folder_key>')
 def gallery_view(folder_key):
-    global gallery_view_cache
-    folders = get_dynamic_folder_config(force_refresh=True)
+    folders = get_dynamic_folder_config(revalidate=True)
     if folder_key not in folders:
         return redirect(url_for('gallery_view', folder_key='_root_'))
 
     current_folder_info = folders[folder_key]
     folder_path = current_folder_info['path']
 
+    # Only the first page is read; load_more() runs the same query for the next ones
+    where, params, order_by = gallery_filter_query(folder_path, request.args)
     with get_db_connection() as conn:
-        conditions, params = [], []
-        conditions.append("path LIKE ?")
-        params.append(folder_path + os.sep + '%')
-
-        sort_by = 'name' if request.args.get('sort_by') == 'name' else 'mtime'
-        sort_order = 'asc' if request.args.get('sort_order', 'desc').lower() == 'asc' else 'desc'
-
-        search_term = request.args.get('search', '').strip()
-        if search_term:
-            conditions.append("name LIKE ?")
-            params.append(f"%{search_term}%")
-        if request.args.get('favorites', 'false').lower() == 'true':
-            conditions.append("is_favorite = 1")
+        total_files = conn.execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+        initial_files = [dict(row) for row in conn.execute(
+            f"SELECT * FROM files WHERE {where} ORDER BY {order_by} LIMIT ?", params + [PAGE_SIZE])]
 
-        # Media type filter
-        selected_media_types = request.args.getlist('media_type')
-        if selected_media_types:
-            type_conditions = []
-            for mt in selected_media_types:
-                if mt == 'image':
-                    type_conditions.append("type IN ('image', 'animated_image')")
-                elif mt == 'video':
-                    type_conditions.append("type = 'video'")
-                elif mt == 'audio':
-                    type_conditions.append("type = 'audio'")
-                elif mt == 'document':
-                    type_conditions.append("type = 'document'")
-            if type_conditions:
-                conditions.append(f"({' OR '.join(type_conditions)})")
-
-        selected_prefixes = request.args.getlist('prefix')
-        if selected_prefixes:
-            prefix_conditions = [f"name LIKE ?" for p in selected_prefixes if p.strip()]
-            params.extend([f"{p.strip()}_%" for p in selected_prefixes if p.strip()])
-            if prefix_conditions: conditions.append(f"({' OR '.join(prefix_conditions)})")
-
-        selected_extensions = request.args.getlist('extension')
-        if selected_extensions:
-            ext_conditions = [f"name LIKE ?" for ext in selected_extensions if ext.strip()]
-            params.extend([f"%.{ext.lstrip('.').lower()}" for ext in selected_extensions if ext.strip()])
-            if ext_conditions: conditions.append(f"({' OR '.join(ext_conditions)})")
-
-        sort_direction = "ASC" if sort_order == 'asc' else "DESC"
-        query = f"SELECT * FROM files WHERE {' AND '.join(conditions)} ORDER BY {sort_by} {sort_direction}"
-
-        all_files_raw = conn.execute(query, params).fetchall()
-
-    folder_path_norm = os.path.normpath(folder_path)
-    all_files_filtered = [dict(row) for row in all_files_raw if os.path.normpath(os.path.dirname(row['path'])) == folder_path_norm]
-
-    # Filter by programs and campaigns (requires social features)
-    selected_programs = request.args.getlist('program')
-    selected_campaigns = request.args.getlist('campaign')
+    # Programs and campaigns for the filter dropdowns (requires social features)
     available_programs = []
     available_campaigns = []
 
@@ -1804,7 +2492,6 @@ def gallery_view(folder_key):
             from social.models import get_social_db
             social_conn = get_social_db(DATABASE_FILE)
             try:
-                # Fetch available programs and campaigns for dropdowns
                 available_programs = [
                     {'id': row['id'], 'name': row['name']}
                     for row in social_conn.execute(
@@ -1817,36 +2504,11 @@ def gallery_view(folder_key):
                         "SELECT id, name FROM campaigns WHERE is_active = 1 ORDER BY sort_order, name"
                     ).fetchall()
                 ]
-
-                # Filter by programs if selected
-                if selected_programs:
-                    program_file_ids = set()
-                    placeholders = ','.join(['?' for _ in selected_programs])
-                    rows = social_conn.execute(
-                        f"SELECT DISTINCT file_id FROM file_programs WHERE program_id IN ({placeholders})",
-                        selected_programs
-                    ).fetchall()
-                    program_file_ids = {row['file_id'] for row in rows}
-                    all_files_filtered = [f for f in all_files_filtered if f['id'] in program_file_ids]
-
-                # Filter by campaigns if selected
-                if selected_campaigns:
-                    campaign_file_ids = set()
-                    placeholders = ','.join(['?' for _ in selected_campaigns])
-                    rows = social_conn.execute(
-                        f"SELECT DISTINCT file_id FROM file_campaigns WHERE campaign_id IN ({placeholders})",
-                        selected_campaigns
-                    ).fetchall()
-                    campaign_file_ids = {row['file_id'] for row in rows}
-                    all_files_filtered = [f for f in all_files_filtered if f['id'] in campaign_file_ids]
-
             finally:
                 social_conn.close()
         except Exception as e:
             print(f"Warning: Could not load programs/campaigns for filtering: {e}")
 
-    gallery_view_cache = all_files_filtered
-    initial_files = gallery_view_cache[:PAGE_SIZE]
     total_folder_files, extensions, prefixes = scan_folder_and_extract_options(folder_path)
     breadcrumbs, ancestor_keys = [], set()
     curr_key = folder_key
@@ -1892,7 +2554,7 @@ def gallery_view(folder_key):
 
     return render_template('index.html',
                            files=initial_files,
-                           total_files=len(gallery_view_cache),
+                           total_files=total_files,
                            total_folder_files=total_folder_files,
                            folders=folders,
                            current_folder_key=folder_key,
@@ -1904,8 +2566,8 @@ def gallery_view(folder_key):
                            selected_extensions=request.args.getlist('extension'),
                            selected_prefixes=request.args.getlist('prefix'),
                            selected_media_types=request.args.getlist('media_type'),
-                           selected_programs=selected_programs,
-                           selected_campaigns=selected_campaigns,
+                           selected_programs=request.args.getlist('program'),
+                           selected_campaigns=request.args.getlist('campaign'),
                            available_programs=available_programs,
                            available_campaigns=available_campaigns,
                            show_favorites=request.args.get('favorites', 'false').lower() == 'true',
@@ -2013,9 +2675,9 @@ def upload_files():
 
     # Sync all affected folders
     if success_count > 0:
-        sync_folder_on_demand(destination_path)
+        sync_folder(destination_path)
         for folder in created_folders:
-            sync_folder_on_demand(folder)
+            sync_folder(folder)
 
     if errors:
         return jsonify({
@@ -2043,18 +2705,10 @@ def rescan_folder():
     
     try:
         with get_db_connection() as conn:
-            # Get all files in this folder
-            query = "SELECT path, last_scanned FROM files WHERE path LIKE ?"
-            params = (folder_path + os.sep + '%',)
-            rows = conn.execute(query, params).fetchall()
-            
-            # Filter files strictly within this folder (not subfolders)
-            folder_path_norm = os.path.normpath(folder_path)
-            files_in_folder = [
-                {'path': row['path'], 'last_scanned': row['last_scanned']} 
-                for row in rows 
-                if os.path.normpath(os.path.dirname(row['path'])) == folder_path_norm
-            ]
+            # Get the files strictly within this folder (not subfolders)
+            folder_condition, params = direct_files_condition(folder_path)
+            rows = conn.execute(f"SELECT path, last_scanned FROM files WHERE {folder_condition}", params).fetchall()
+            files_in_folder = [{'path': row['path'], 'last_scanned': row['last_scanned']} for row in rows]
             
             files_to_process = []
             current_time = time.time()
@@ -2075,20 +2729,14 @@ def rescan_folder():
             processed_count = 0
             results = []
             
-            with concurrent.futures.ProcessPoolExecutor(max_workers=MAX_PARALLEL_WORKERS) as executor:
-                futures = {executor.submit(process_single_file, path): path for path in files_to_process}
-                for future in concurrent.futures.as_completed(futures):
-                    result = future.result()
-                    if result:
-                        results.append(result)
-                    processed_count += 1
+            for _, result in process_files(files_to_process):
+                if result:
+                    results.append(result)
+                processed_count += 1
             
             if results:
                 # Upsert results
-                conn.executemany(
-                    "INSERT OR REPLACE INTO files (id, path, mtime, name, type, duration, dimensions, has_workflow, size, last_scanned, models, loras, input_files, media_created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    results
-                )
+                upsert_files(conn, results)
                 conn.commit()
 
         return jsonify({'status': 'success', 'message': f'Successfully rescanned {len(results)} files.', 'count': len(results)})
@@ -2162,8 +2810,8 @@ def rescan_all_folders():
                         # Check if thumbnail exists
                         try:
                             mtime = os.path.getmtime(f)
-                            file_hash = hashlib.md5((f + str(mtime)).encode()).hexdigest()
-                            if not glob.glob(os.path.join(THUMBNAIL_CACHE_DIR, f"{file_hash}.*")):
+                            file_hash = _thumbnail_hash(f, mtime)
+                            if not find_cached_thumbnail(file_hash):
                                 files_to_process.append(f)
                         except OSError:
                             pass
@@ -2193,20 +2841,14 @@ def rescan_all_folders():
                 batch = files_to_process[i:i + batch_size]
                 batch_results = []
 
-                with concurrent.futures.ProcessPoolExecutor(max_workers=MAX_PARALLEL_WORKERS) as executor:
-                    futures = {executor.submit(process_single_file, fp): fp for fp in batch}
-                    for future in concurrent.futures.as_completed(futures):
-                        result = future.result()
-                        if result:
-                            batch_results.append(result)
-                        processed_count += 1
+                for _, result in process_files(batch):
+                    if result:
+                        batch_results.append(result)
+                    processed_count += 1
 
                 # Commit batch to database immediately
                 if batch_results:
-                    conn.executemany(
-                        "INSERT OR REPLACE INTO files (id, path, mtime, name, type, duration, dimensions, has_workflow, size, last_scanned, models, loras, input_files, media_created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        batch_results
-                    )
+                    upsert_files(conn, batch_results)
                     conn.commit()
                     total_rescanned += len(batch_results)
 
@@ -2238,7 +2880,8 @@ def create_folder():
     new_folder_path = os.path.join(parent_path, folder_name)
     try:
         os.makedirs(new_folder_path, exist_ok=False)
-        sync_folder_on_demand(parent_path)
+        invalidate_folder_config()
+        sync_folder(parent_path)
         return jsonify({'status': 'success', 'message': f'Folder "{folder_name}" created successfully.'})
     except FileExistsError: return jsonify({'status': 'error', 'message': 'Folder already exists.'}), 400
     except Exception as e: return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -2274,8 +2917,15 @@ def background_zip_task(job_id, file_ids):
                 file_name = file_row['name']
                 # Check the file exists
                 if os.path.exists(file_path):
-                    # Add file to zip
-                    zf.write(file_path, file_name)
+                    if os.path.splitext(file_name)[1].lower() in ZIP_STORED_EXTENSIONS:
+                        # Already-compressed media is stored as is; deflating it costs CPU for next to no gain.
+                        # Storing is a plain copy, so it gets a larger buffer than ZipFile.write()'s 8 KB.
+                        zinfo = zipfile.ZipInfo.from_file(file_path, file_name)
+                        zinfo.compress_type = zipfile.ZIP_STORED
+                        with open(file_path, 'rb') as src, zf.open(zinfo, 'w') as dest:
+                            shutil.copyfileobj(src, dest, ZIP_COPY_BUFFER_SIZE)
+                    else:
+                        zf.write(file_path, file_name)
         
         # Job completed succesfully
         zip_jobs[job_id] = {
@@ -2329,6 +2979,24 @@ def serve_zip_file(filename):
     return send_from_directory(ZIP_CACHE_DIR, filename, as_attachment=True)
     
 
+def _md5_hex(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+def _rewrite_folder_paths(conn, old_path, new_path):
+    """
+    Re-points every file under old_path to new_path (new path and path-derived id) with
+    one UPDATE: the path is rewritten by SQLite and the id recomputed by an md5_hex()
+    SQL function, so no rows travel through Python. The rows are selected by a binary
+    range on the path index (see direct_files_condition()). The caller commits.
+    """
+    conn.create_function('md5_hex', 1, _md5_hex, deterministic=True)
+    prefix = os.path.join(old_path, '')
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    conn.execute(
+        "UPDATE files SET path = :new || substr(path, :cut), id = md5_hex(:new || substr(path, :cut)) "
+        "WHERE path >= :prefix AND path < :upper",
+        {'new': new_path, 'cut': len(old_path) + 1, 'prefix': prefix, 'upper': upper})
+
 @app.route('/galleryout/rename_folder/<string:folder_key>', methods=['POST'])
 def rename_folder(folder_key):
     if folder_key in PROTECTED_FOLDER_KEYS: return jsonify({'status': 'error', 'message': 'This folder cannot be renamed.'}), 403
@@ -2340,18 +3008,13 @@ def rename_folder(folder_key):
     new_path = os.path.join(os.path.dirname(old_path), new_name)
     if os.path.exists(new_path): return jsonify({'status': 'error', 'message': 'A folder with this name already exists.'}), 400
     try:
+        os.rename(old_path, new_path)
+        # The write lock is only taken once the disk work is done
         with get_db_connection() as conn:
-            old_path_like = old_path + os.sep + '%'
-            files_to_update = conn.execute("SELECT id, path FROM files WHERE path LIKE ?", (old_path_like,)).fetchall()
-            update_data = []
-            for row in files_to_update:
-                new_file_path = row['path'].replace(old_path, new_path, 1)
-                new_id = hashlib.md5(new_file_path.encode()).hexdigest()
-                update_data.append((new_id, new_file_path, row['id']))
-            os.rename(old_path, new_path)
-            if update_data: conn.executemany("UPDATE files SET id = ?, path = ? WHERE id = ?", update_data)
+            _begin_immediate(conn)
+            _rewrite_folder_paths(conn, old_path, new_path)
             conn.commit()
-        get_dynamic_folder_config(force_refresh=True)
+        invalidate_folder_config()
         return jsonify({'status': 'success', 'message': 'Folder renamed.'})
     except Exception as e: return jsonify({'status': 'error', 'message': f'Error: {e}'}), 500
 
@@ -2366,7 +3029,7 @@ def delete_folder(folder_key):
             conn.execute("DELETE FROM files WHERE path LIKE ?", (folder_path + os.sep + '%',))
             conn.commit()
         shutil.rmtree(folder_path)
-        get_dynamic_folder_config(force_refresh=True)
+        invalidate_folder_config()
         return jsonify({'status': 'success', 'message': 'Folder deleted.'})
     except Exception as e: return jsonify({'status': 'error', 'message': f'Error: {e}'}), 500
 
@@ -2405,25 +3068,17 @@ def move_folder(folder_key):
         folder_name = os.path.basename(new_path)
 
     try:
+        # Move the folder on disk before taking the write lock: a cross-filesystem
+        # move copies the whole tree, and other writers would time out meanwhile
+        shutil.move(source_path, new_path)
+
+        # Update all file paths in the database
         with get_db_connection() as conn:
-            # Update all file paths in the database
-            old_path_like = source_path + os.sep + '%'
-            files_to_update = conn.execute("SELECT id, path FROM files WHERE path LIKE ?", (old_path_like,)).fetchall()
-            update_data = []
-            for row in files_to_update:
-                new_file_path = row['path'].replace(source_path, new_path, 1)
-                new_id = hashlib.md5(new_file_path.encode()).hexdigest()
-                update_data.append((new_id, new_file_path, row['id']))
-
-            # Move the folder on disk
-            shutil.move(source_path, new_path)
-
-            # Update database records
-            if update_data:
-                conn.executemany("UPDATE files SET id = ?, path = ? WHERE id = ?", update_data)
+            _begin_immediate(conn)
+            _rewrite_folder_paths(conn, source_path, new_path)
             conn.commit()
 
-        get_dynamic_folder_config(force_refresh=True)
+        invalidate_folder_config()
         return jsonify({
             'status': 'success',
             'message': f'Folder moved successfully.',
@@ -2434,9 +3089,15 @@ def move_folder(folder_key):
 
 @app.route('/galleryout/load_more')
 def load_more():
-    offset = request.args.get('offset', 0, type=int)
-    if offset >= len(gallery_view_cache): return jsonify(files=[])
-    return jsonify(files=gallery_view_cache[offset:offset + PAGE_SIZE])
+    offset = max(0, request.args.get('offset', 0, type=int))
+    folders = get_dynamic_folder_config()
+    folder_key = request.args.get('folder_key', '_root_')
+    if folder_key not in folders: return jsonify(files=[])
+    where, params, order_by = gallery_filter_query(folders[folder_key]['path'], request.args)
+    with get_db_connection() as conn:
+        rows = conn.execute(f"SELECT * FROM files WHERE {where} ORDER BY {order_by} LIMIT ? OFFSET ?",
+                            params + [PAGE_SIZE, offset])
+        return jsonify(files=[dict(row) for row in rows])
 
 def get_file_info_from_db(file_id, column='*'):
     with get_db_connection() as conn:
@@ -2444,15 +3105,62 @@ def get_file_info_from_db(file_id, column='*'):
     if not row: abort(404)
     return dict(row) if column == '*' else row[0]
 
-def _get_unique_filepath(destination_folder, filename):
-    base, ext = os.path.splitext(filename)
-    counter = 1
-    new_filepath = os.path.join(destination_folder, filename)
-    while os.path.exists(new_filepath):
-        new_filename = f"{base}({counter}){ext}"
-        new_filepath = os.path.join(destination_folder, new_filename)
-        counter += 1
-    return new_filepath
+def _folder_name_key(name):
+    # Windows and macOS filesystems are case-insensitive by default
+    return name.casefold() if sys.platform in ('win32', 'darwin') else name
+
+def _list_folder_names(folder_path):
+    """
+    Returns the set of entry names in a folder from a single os.scandir pass.
+    Raises OSError if the folder cannot be listed: an empty set would make every name
+    look free, and a move onto an existing name would replace that file.
+    """
+    with os.scandir(folder_path) as entries:
+        return {_folder_name_key(entry.name) for entry in entries}
+
+def _get_unique_filepath(destination_folder, filename, existing_names):
+    """
+    Resolves a non-conflicting path in destination_folder without touching the disk.
+    existing_names comes from _list_folder_names() and is updated with the chosen
+    name, so repeated calls within one batch never hand out the same name twice;
+    calling again after a hit on disk returns the next free candidate.
+    """
+    name_key = _folder_name_key(filename)
+    new_filename = filename
+    if name_key in existing_names:
+        # Only split the name once a conflict actually needs a numbered candidate
+        base, ext = os.path.splitext(filename)
+        counter = 1
+        while name_key in existing_names:
+            new_filename = f"{base}({counter}){ext}"
+            name_key = _folder_name_key(new_filename)
+            counter += 1
+    existing_names.add(name_key)
+    return os.path.join(destination_folder, new_filename)
+
+def _install_move_history_trigger(conn, moved_by):
+    """
+    Installs a connection-scoped (TEMP) trigger that records a file_move_history
+    row whenever a file's path changes, so move_batch only needs one UPDATE per file.
+    The trigger lives only on this connection, so folder renames and other path
+    updates elsewhere are not logged as moves.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS move_context (moved_by TEXT)")
+    conn.execute("DELETE FROM temp.move_context")
+    conn.execute("INSERT INTO temp.move_context (moved_by) VALUES (?)", (moved_by,))
+    conn.execute("""
+        CREATE TEMP TRIGGER IF NOT EXISTS log_file_move
+        AFTER UPDATE OF path ON main.files
+        WHEN OLD.path != NEW.path
+        BEGIN
+            INSERT INTO file_move_history (id, file_id, from_path, to_path, moved_at, moved_by)
+            VALUES (
+                lower(hex(randomblob(16))), NEW.id, OLD.path, NEW.path,
+                (julianday('now') - 2440587.5) * 86400.0,
+                (SELECT moved_by FROM move_context LIMIT 1)
+            );
+        END
+    """)
 
 @app.route('/galleryout/move_batch', methods=['POST'])
 def move_batch():
@@ -2473,53 +3181,67 @@ def move_batch():
         except Exception:
             pass
 
+    try:
+        existing_dest_names = _list_folder_names(dest_path_folder)
+    except OSError as e:
+        return jsonify({'status': 'error', 'message': f'Could not read the destination folder: {e}'}), 500
+
     with get_db_connection() as conn:
+        placeholders = ','.join('?' * len(file_ids))
+        file_rows = {row['id']: row for row in conn.execute(
+            f"SELECT id, path, name, original_path FROM files WHERE id IN ({placeholders})", file_ids)}
+        # The database is written once after all files have moved: (new_id, path, name, original_path, old_id)
+        updates, missing_ids = [], []
         for file_id in file_ids:
             source_path = None
             try:
-                file_info = conn.execute(
-                    "SELECT path, name, original_path, source_type, sp_item_id, sp_drive_id, sp_original_path, sp_sync_timestamp FROM files WHERE id = ?",
-                    (file_id,)
-                ).fetchone()
+                file_info = file_rows.get(file_id)
                 if not file_info:
                     failed_files.append(f"ID {file_id} not found in DB")
                     continue
                 source_path, source_filename = file_info['path'], file_info['name']
                 if not os.path.exists(source_path):
                     failed_files.append(f"{source_filename} (not found on disk)")
-                    conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                    missing_ids.append((file_id,))
                     continue
-                final_dest_path = _get_unique_filepath(dest_path_folder, source_filename)
+                final_dest_path = _get_unique_filepath(dest_path_folder, source_filename, existing_dest_names)
+                # The listing can be stale (files arriving during a long batch) or miss a
+                # case-insensitive mount on Linux, and os.rename would replace the file there
+                while os.path.exists(final_dest_path):
+                    final_dest_path = _get_unique_filepath(dest_path_folder, source_filename, existing_dest_names)
                 final_filename = os.path.basename(final_dest_path)
                 if final_filename != source_filename: renamed_count += 1
-                shutil.move(source_path, final_dest_path)
-                new_id = hashlib.md5(final_dest_path.encode()).hexdigest()
+                try:
+                    os.rename(source_path, final_dest_path)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.move(source_path, final_dest_path)  # Other filesystem: copy, then delete
+                if os.path.normpath(os.path.dirname(source_path)) == os.path.normpath(dest_path_folder):
+                    # The file left its old name in the destination folder free for later files
+                    existing_dest_names.discard(_folder_name_key(os.path.basename(source_path)))
 
                 # Preserve origin metadata and set original_path if not already set
                 original_path = file_info['original_path'] or source_path
-                conn.execute("""
-                    UPDATE files SET
-                        id = ?,
-                        path = ?,
-                        name = ?,
-                        original_path = ?
-                    WHERE id = ?
-                """, (new_id, final_dest_path, final_filename, original_path, file_id))
-
-                # Log move history
-                move_history_id = str(uuid.uuid4())
-                now = time.time()
-                conn.execute("""
-                    INSERT INTO file_move_history (id, file_id, from_path, to_path, moved_at, moved_by)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (move_history_id, new_id, source_path, final_dest_path, now, moved_by_user_id))
-
+                updates.append((hashlib.md5(final_dest_path.encode()).hexdigest(), final_dest_path,
+                                final_filename, original_path, file_id))
                 moved_count += 1
             except Exception as e:
                 filename_for_error = os.path.basename(source_path) if source_path else f"ID {file_id}"
                 failed_files.append(filename_for_error)
                 print(f"ERROR: Failed to move file {filename_for_error}. Reason: {e}")
                 continue
+        # The write lock is only held for the database writes, not the file moves above
+        _begin_immediate(conn)
+        # Move history rows are written by the trigger as part of each UPDATE
+        _install_move_history_trigger(conn, moved_by_user_id)
+        conn.executemany("DELETE FROM files WHERE id = ?", missing_ids)
+        # Rows left at the destination paths are stale (the names were free on disk) and would block the UPDATE,
+        # except those of files this batch moved away from a name it then reused; the UPDATEs re-point them in order
+        moved_from = {file_rows[update[4]]['path'] for update in updates}
+        conn.executemany("DELETE FROM files WHERE path = ?",
+                         [(update[1],) for update in updates if update[1] not in moved_from])
+        conn.executemany("UPDATE files SET id = ?, path = ?, name = ?, original_path = ? WHERE id = ?", updates)
         conn.commit()
     message = f"Successfully moved {moved_count} file(s)."
     if renamed_count > 0: message += f" {renamed_count} were renamed to avoid conflicts."
@@ -2537,13 +3259,18 @@ def delete_batch():
         ids_to_remove_from_db = []
         for row in files_to_delete:
             try:
-                if os.path.exists(row['path']): safe_delete_file(row['path'])
+                try:
+                    safe_delete_file(row['path'])
+                except FileNotFoundError:
+                    pass  # Already gone from disk; just drop the stale DB row
                 ids_to_remove_from_db.append(row['id'])
                 deleted_count += 1
             except Exception as e: 
                 failed_files.append(os.path.basename(row['path']))
                 print(f"ERROR: Could not delete {row['path']}: {e}")
         if ids_to_remove_from_db:
+            # Taken after the trash moves above so other writers are not locked out meanwhile
+            _begin_immediate(conn)
             db_placeholders = ','.join('?' * len(ids_to_remove_from_db))
             conn.execute(f"DELETE FROM files WHERE id IN ({db_placeholders})", ids_to_remove_from_db)
             conn.commit()
@@ -2558,6 +3285,7 @@ def favorite_batch():
     file_ids, status = data.get('file_ids', []), data.get('status', False)
     if not file_ids: return jsonify({'status': 'error', 'message': 'No files selected'}), 400
     with get_db_connection() as conn:
+        _begin_immediate(conn)
         placeholders = ','.join('?' * len(file_ids))
         conn.execute(f"UPDATE files SET is_favorite = ? WHERE id IN ({placeholders})", [1 if status else 0] + file_ids)
         conn.commit()
@@ -2620,10 +3348,8 @@ def rename_file(file_id):
             old_name = file_info['name']
             
             # Preserve the original extension
-            _, old_ext = os.path.splitext(old_name)
-            new_name_base, new_ext = os.path.splitext(new_name)
-            if not new_ext: # If user didn't provide an extension, use the old one
-                final_new_name = new_name + old_ext
+            if not os.path.splitext(new_name)[1]: # If user didn't provide an extension, use the old one
+                final_new_name = new_name + os.path.splitext(old_name)[1]
             else:
                 final_new_name = new_name
 
@@ -2668,9 +3394,13 @@ def _get_video_mimetype(filepath):
     }
     return mimetypes.get(ext, 'video/mp4')
 
-def _stream_video(filepath, start, chunk_size=8192):
+# 256 KiB matches typical disk readahead and socket send buffers, so each
+# generator step is one unbuffered read instead of dozens of 8 KiB reads.
+VIDEO_STREAM_CHUNK_SIZE = 256 * 1024
+
+def _stream_video(filepath, start, chunk_size=VIDEO_STREAM_CHUNK_SIZE):
     """Generator to stream video file in chunks."""
-    with open(filepath, 'rb') as f:
+    with open(filepath, 'rb', buffering=0) as f:
         f.seek(start)
         while True:
             chunk = f.read(chunk_size)
@@ -2706,11 +3436,11 @@ def serve_file(file_id):
 
             # Stream the requested range
             def generate():
-                with open(filepath, 'rb') as f:
+                with open(filepath, 'rb', buffering=0) as f:
                     f.seek(byte_start)
                     remaining = content_length
                     while remaining > 0:
-                        chunk_size = min(8192, remaining)
+                        chunk_size = min(VIDEO_STREAM_CHUNK_SIZE, remaining)
                         chunk = f.read(chunk_size)
                         if not chunk:
                             break
@@ -2785,24 +3515,30 @@ def _extract_api_workflow(filepath):
         """Check if data is a UI format workflow (has 'nodes' array)"""
         return isinstance(data, dict) and 'nodes' in data
 
+    def found_both():
+        return api_workflow is not None and ui_workflow is not None
+
     def check_data(data, tag_name=None):
         nonlocal api_workflow, ui_workflow
         if not isinstance(data, dict):
             return
 
         # Direct check: is this data itself a workflow?
-        if is_api_format(data) and not api_workflow:
+        # Format checks are skipped for a slot that is already filled.
+        if not api_workflow and is_api_format(data):
             api_workflow = data
-        elif is_ui_format(data) and not ui_workflow:
+        elif not ui_workflow and is_ui_format(data):
             ui_workflow = data
 
         # Also check nested keys for wrapped formats
         for key in ['prompt', 'workflow']:
+            if found_both():
+                return
             nested = data.get(key)
             if nested:
-                if is_api_format(nested) and not api_workflow:
+                if not api_workflow and is_api_format(nested):
                     api_workflow = nested
-                elif is_ui_format(nested) and not ui_workflow:
+                elif not ui_workflow and is_ui_format(nested):
                     ui_workflow = nested
 
     if ext in video_exts:
@@ -2816,6 +3552,8 @@ def _extract_api_workflow(filepath):
                 data = json.loads(result.stdout)
                 if 'format' in data and 'tags' in data['format']:
                     for tag_name, value in data['format']['tags'].items():
+                        if found_both():
+                            break
                         if isinstance(value, str) and value.strip().startswith('{'):
                             try:
                                 parsed = json.loads(value)
@@ -2826,15 +3564,20 @@ def _extract_api_workflow(filepath):
                 pass
     else:
         try:
-            with Image.open(filepath) as img:
-                for key in ['prompt', 'workflow']:
-                    val = img.info.get(key)
-                    if val:
-                        try:
-                            parsed = json.loads(val)
-                            check_data(parsed, key)
-                        except:
-                            continue
+            info = _read_png_text(filepath) if ext == '.png' else None
+            if info is None:
+                with Image.open(filepath) as img:
+                    info = img.info
+            for key in ['prompt', 'workflow']:
+                if found_both():
+                    break
+                val = info.get(key)
+                if val:
+                    try:
+                        parsed = json.loads(val)
+                        check_data(parsed, key)
+                    except:
+                        continue
         except Exception:
             pass
 
@@ -2860,11 +3603,7 @@ def _convert_ui_workflow_to_api(ui_workflow):
         links = ui_workflow.get('links', [])
 
         # Build a link lookup: link_id -> (source_node_id, source_slot)
-        link_map = {}
-        for link in links:
-            if len(link) >= 4:
-                link_id, source_node, source_slot, target_node = link[0], link[1], link[2], link[3]
-                link_map[link_id] = (source_node, source_slot)
+        link_map = {link[0]: (link[1], link[2]) for link in links if len(link) >= 4}
 
         for node in nodes:
             node_id = str(node.get('id'))
@@ -2873,19 +3612,18 @@ def _convert_ui_workflow_to_api(ui_workflow):
             if not node_type:
                 continue
 
-            # Build inputs from widgets_values and connected links
-            inputs = {}
-
-            # First, add widget values
+            # Build inputs from widgets_values and connected links.
+            # First, add widget values: known names pair up positionally,
+            # any extra widgets get generic parameter names.
             widgets_values = node.get('widgets_values', [])
-            param_names = NODE_PARAM_NAMES.get(node_type, [])
-
-            for i, value in enumerate(widgets_values):
-                if i < len(param_names):
-                    inputs[param_names[i]] = value
-                else:
-                    # Use generic parameter names for unknown widgets
-                    inputs[f'widget_{i}'] = value
+            param_names = NODE_PARAM_NAMES.get(node_type, ())
+            inputs = dict(zip(param_names, widgets_values))
+            named_count = len(param_names)
+            if len(widgets_values) > named_count:
+                inputs.update(
+                    (f'widget_{i}', value)
+                    for i, value in enumerate(itertools.islice(widgets_values, named_count, None), start=named_count)
+                )
 
             # Then handle input connections
             node_inputs = node.get('inputs', [])
@@ -2911,6 +3649,15 @@ def _convert_ui_workflow_to_api(ui_workflow):
         print(f"ERROR: Failed to convert UI workflow to API format: {e}")
         return None
 
+# Shared HTTP session so repeated "send to" and status calls reuse the same
+# keep-alive connection to the workflow tool instead of reconnecting each time.
+comfyui_session = requests.Session()
+# The server is threaded, so allow a few concurrent requests to keep their own connection
+comfyui_session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16))
+comfyui_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=16))
+COMFYUI_PROMPT_URL = f"{COMFYUI_URL.rstrip('/')}/prompt"
+COMFYUI_STATUS_URL = f"{COMFYUI_URL.rstrip('/')}/system_stats"
+
 @app.route('/galleryout/send_to_comfyui/<string:file_id>', methods=['POST'])
 def send_to_comfyui(file_id):
     """
@@ -2978,41 +3725,41 @@ def send_to_comfyui(file_id):
             prompt_payload['client_id'] = client_id
 
         # Send to workflow tool
-        comfyui_prompt_url = f"{COMFYUI_URL.rstrip('/')}/prompt"
-
-        req = urllib.request.Request(
-            comfyui_prompt_url,
-            data=json.dumps(prompt_payload).encode('utf-8'),
-            headers={'Content-Type': 'application/json'},
-            method='POST'
-        )
-
         try:
-            with urllib.request.urlopen(req, timeout=10) as response:
-                response_data = json.loads(response.read().decode('utf-8'))
+            response = comfyui_session.post(COMFYUI_PROMPT_URL, json=prompt_payload, timeout=10)
+            response.raise_for_status()
+            response_data = response.json()
 
-                return jsonify({
-                    'status': 'success',
-                    'action': 'queue',
-                    'message': 'Workflow sent successfully!',
-                    'prompt_id': response_data.get('prompt_id'),
-                    'number': response_data.get('number'),
-                    'comfyui_url': COMFYUI_URL
-                })
+            return jsonify({
+                'status': 'success',
+                'action': 'queue',
+                'message': 'Workflow sent successfully!',
+                'prompt_id': response_data.get('prompt_id'),
+                'number': response_data.get('number'),
+                'comfyui_url': COMFYUI_URL
+            })
+
+        except requests.HTTPError as e:
+            # HTTPError must come before RequestException (it's a subclass)
+            status_code = e.response.status_code
+            return jsonify({
+                'status': 'error',
+                'message': f'Workflow tool returned an error: {status_code} - {e.response.text}'
+            }), status_code
 
-        except urllib.error.HTTPError as e:
-            # HTTPError must come before URLError (it's a subclass)
-            error_body = e.read().decode('utf-8', errors='ignore')
+        except ValueError:
+            # A non-JSON body: requests raises its JSONDecodeError, a ValueError that
+            # is also a RequestException, so it must be caught first
             return jsonify({
                 'status': 'error',
-                'message': f'Workflow tool returned an error: {e.code} - {error_body}'
-            }), e.code
+                'message': 'Invalid response from workflow tool.'
+            }), 502
 
-        except urllib.error.URLError as e:
+        except requests.RequestException as e:
             return jsonify({
                 'status': 'error',
                 'message': f'Could not connect to workflow tool at {COMFYUI_URL}. '
-                           f'Is it running? Error: {str(e.reason)}'
+                           f'Is it running? Error: {str(e)}'
             }), 503
 
     except json.JSONDecodeError:
@@ -3034,20 +3781,23 @@ def comfyui_status():
     Useful for the frontend to show connection status.
     """
     try:
-        status_url = f"{COMFYUI_URL.rstrip('/')}/system_stats"
+        response = comfyui_session.get(COMFYUI_STATUS_URL, timeout=5)
+        response.raise_for_status()
 
-        req = urllib.request.Request(status_url, method='GET')
-
-        with urllib.request.urlopen(req, timeout=5) as response:
-            data = json.loads(response.read().decode('utf-8'))
-
-            return jsonify({
-                'status': 'online',
-                'comfyui_url': COMFYUI_URL,
-                'system_stats': data
-            })
+        return jsonify({
+            'status': 'online',
+            'comfyui_url': COMFYUI_URL,
+            'system_stats': response.json()
+        })
 
-    except urllib.error.URLError:
+    except ValueError:
+        # Must precede RequestException, which requests' JSONDecodeError also subclasses
+        return jsonify({
+            'status': 'error',
+            'comfyui_url': COMFYUI_URL,
+            'message': 'Invalid response from workflow tool.'
+        }), 502
+    except requests.RequestException:
         return jsonify({
             'status': 'offline',
             'comfyui_url': COMFYUI_URL,
@@ -3124,45 +3874,144 @@ def compare_workflows():
 def serve_thumbnail(file_id):
     info = get_file_info_from_db(file_id)
     filepath, mtime = info['path'], info['mtime']
-    file_hash = hashlib.md5((filepath + str(mtime)).encode()).hexdigest()
-    existing_thumbnails = glob.glob(os.path.join(THUMBNAIL_CACHE_DIR, f"{file_hash}.*"))
-    if existing_thumbnails:
-        response = send_file(existing_thumbnails[0], conditional=True)
-        response.headers['Cache-Control'] = 'public, max-age=86400'  # Cache for 24 hours
-        return response
-    print(f"WARN: Thumbnail not found for {os.path.basename(filepath)}, generating...")
-    cache_path = create_thumbnail(filepath, file_hash, info['type'])
+    file_hash = _thumbnail_hash(filepath, mtime)
+    cache_path = ensure_thumbnail(filepath, file_hash, info['type'])
     if cache_path and os.path.exists(cache_path):
-        response = send_file(cache_path, conditional=True)
-        response.headers['Cache-Control'] = 'public, max-age=86400'
-        return response
+        return send_thumbnail(cache_path)
     return "Thumbnail generation failed", 404
 
 @app.route('/favicon.ico')
 def favicon():
     return send_file('static/galleryout/favicon.ico')
 
+# Browser cache lifetime for source input files (1 hour). Flask already sends an
+# ETag/Last-Modified, so once this expires the browser revalidates and gets a 304.
+INPUT_FILE_MAX_AGE = 3600
+
+def resolve_input_path(rel_path):
+    """
+    Absolute path of rel_path inside the input directory, or None if it points outside it.
+    Joins onto the precomputed BASE_INPUT_ABSPATH, so only a normpath is needed per call.
+    """
+    filepath = os.path.normpath(os.path.join(BASE_INPUT_ABSPATH, rel_path))
+    if filepath != BASE_INPUT_ABSPATH and not filepath.startswith(os.path.join(BASE_INPUT_ABSPATH, '')):
+        return None
+    return filepath
+
 @app.route('/galleryout/input_file/<path:filename>')
 def serve_input_file(filename):
     """Serves input files directly from the source media input folder."""
     try:
         # Prevent path traversal
         filename = secure_filename(filename)
-        filepath = os.path.abspath(os.path.join(BASE_INPUT_PATH, filename))
-        if not filepath.startswith(os.path.abspath(BASE_INPUT_PATH)):
+        if resolve_input_path(filename) is None:
             abort(403)
         
         # For webp, frocing the correct mimetype
         if filename.lower().endswith('.webp'):
-            return send_from_directory(BASE_INPUT_PATH, filename, mimetype='image/webp', as_attachment=False)
+            return send_from_directory(BASE_INPUT_PATH, filename, mimetype='image/webp', as_attachment=False,
+                                       conditional=True, max_age=INPUT_FILE_MAX_AGE)
         
         # For all the other files, I let Flask guessing the mimetype, but disable the attachment, just a lil trick
-        return send_from_directory(BASE_INPUT_PATH, filename, as_attachment=False)
+        return send_from_directory(BASE_INPUT_PATH, filename, as_attachment=False,
+                                   conditional=True, max_age=INPUT_FILE_MAX_AGE)
     except Exception as e:
         abort(404)
 
 # --- SMASH CUT GENERATOR ---
-smashcut_jobs = {}
+class ExpiringJobStore:
+    """
+    Thread-safe map of job_id -> status dict for background jobs. A job is forgotten
+    ttl seconds after its last update, and at most max_jobs are kept (oldest dropped
+    first), so a long-running server doesn't accumulate every job it has ever run.
+    """
+    def __init__(self, ttl, max_jobs):
+        self._ttl = ttl
+        self._max_jobs = max_jobs
+        self._jobs = {}  # job_id -> (expires_at, status); insertion order == expiry order
+        self._lock = threading.Lock()
+
+    def __setitem__(self, job_id, status):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._jobs[job_id] = (time.monotonic() + self._ttl, status)
+            self._prune()
+
+    def get(self, job_id, default=None):
+        with self._lock:
+            self._prune()
+            entry = self._jobs.get(job_id)
+            return entry[1] if entry else default
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._jobs:
+            oldest_id = next(iter(self._jobs))
+            if self._jobs[oldest_id][0] > now and len(self._jobs) <= self._max_jobs:
+                break
+            del self._jobs[oldest_id]
+
+# Finished output files are removed separately by the maintenance task (SMASHCUT_RETENTION_HOURS)
+smashcut_jobs = ExpiringJobStore(ttl=24 * 3600, max_jobs=1024)
+
+# Jobs are handed to a fixed pool of worker threads instead of one thread per request,
+# so a burst of requests queues up rather than starting that many ffmpeg encodes at once.
+smashcut_queue = queue.Queue()
+_smashcut_workers_lock = threading.Lock()
+_smashcut_workers_started = False
+
+def _smashcut_worker():
+    while True:
+        job_id, video_ids, options = smashcut_queue.get()
+        try:
+            background_smashcut_task(job_id, video_ids, options)
+        finally:
+            smashcut_queue.task_done()
+
+def _ensure_smashcut_workers():
+    """Starts the smash cut worker threads on first use."""
+    global _smashcut_workers_started
+    with _smashcut_workers_lock:
+        if _smashcut_workers_started:
+            return
+        for i in range(SMASHCUT_MAX_CONCURRENT_JOBS):
+            threading.Thread(target=_smashcut_worker, name=f'smashcut-worker-{i}', daemon=True).start()
+        _smashcut_workers_started = True
+
+def _probe_stream_signature(ffprobe_path, path):
+    """
+    Returns a hashable summary of a clip's audio/video stream parameters, or None if the
+    clip cannot be probed. Clips with identical signatures can be joined with '-c copy'.
+    """
+    try:
+        return _cached_stream_signature(ffprobe_path, path, os.path.getmtime(path))
+    except Exception:
+        return None
+
+# Keyed by mtime so each clip version is only probed once; failures raise and are not cached
+@functools.lru_cache(maxsize=1024)
+def _cached_stream_signature(ffprobe_path, path, mtime):
+    cmd = [ffprobe_path, '-v', 'error', '-show_entries',
+           'stream=codec_type,codec_name,width,height,pix_fmt,r_frame_rate,sample_rate,channels',
+           '-of', 'json', path]
+    result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8',
+                            errors='ignore', check=True,
+                            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0)
+    streams = json.loads(result.stdout).get('streams', [])
+    return tuple(
+        (s.get('codec_type'), s.get('codec_name'), s.get('width'), s.get('height'),
+         s.get('pix_fmt'), s.get('r_frame_rate'), s.get('sample_rate'), s.get('channels'))
+        for s in streams if s.get('codec_type') in ('video', 'audio')
+    )
+
+def _clips_support_stream_copy(paths):
+    """True if every clip has the same stream layout and codec parameters (probed in parallel)."""
+    ffprobe_path = FFPROBE_EXECUTABLE_PATH or find_ffprobe_path()
+    if not ffprobe_path or not paths:
+        return False
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(paths))) as executor:
+        signatures = list(executor.map(lambda p: _probe_stream_signature(ffprobe_path, p), paths))
+    return bool(signatures[0]) and all(sig == signatures[0] for sig in signatures)
 
 def background_smashcut_task(job_id, video_ids, options):
     """
@@ -3174,6 +4023,7 @@ def background_smashcut_task(job_id, video_ids, options):
     - quality: "low" | "medium" | "high"
     - output_filename: optional custom filename
     """
+    concat_list_path = None
     try:
         ffmpeg_path = find_ffmpeg_path()
         if not ffmpeg_path:
@@ -3206,14 +4056,25 @@ def background_smashcut_task(job_id, video_ids, options):
         output_filename = secure_filename(output_filename)
         output_path = os.path.join(SMASHCUT_OUTPUT_DIR, output_filename)
 
+        # Escape single quotes in paths for ffmpeg and write the whole list in one call
+        concat_lines = []
+        for video in ordered_videos:
+            escaped_path = video['path'].replace("'", "'\\''")
+            concat_lines.append(f"file '{escaped_path}'\n")
         with open(concat_list_path, 'w', encoding='utf-8') as f:
-            for video in ordered_videos:
-                # Escape single quotes in path for ffmpeg
-                escaped_path = video['path'].replace("'", "'\\''")
-                f.write(f"file '{escaped_path}'\n")
+            f.write(''.join(concat_lines))
 
         # Build ffmpeg command
-        cmd = [ffmpeg_path, '-y', '-f', 'concat', '-safe', '0', '-i', concat_list_path]
+        input_args = [ffmpeg_path, '-y']
+        ffmpeg_version = get_ffmpeg_version(ffmpeg_path)
+        if ffmpeg_version and ffmpeg_version >= (6, 0):
+            # ffmpeg 6.0 (commits c469c3c3b1..48be6616d0) made the concat demuxer re-read every
+            # MP4 input from the start to locate its moov atom, which goes quadratic with many
+            # clips. Declaring the inputs non-seekable avoids the rescan; older builds never
+            # had the regression, so they are left alone.
+            input_args.extend(['-seekable', '0'])
+        input_args.extend(['-thread_queue_size', '1024', '-f', 'concat', '-safe', '0', '-i', concat_list_path])
+        cmd = list(input_args)
 
         # Resolution handling
         resolution = options.get('resolution', 'original')
@@ -3267,21 +4128,28 @@ def background_smashcut_task(job_id, video_ids, options):
             'total': len(ordered_videos)
         }
 
-        # Run ffmpeg
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
-        )
+        # When no scaling or frame rate change is requested and every clip shares the same
+        # codec parameters, the concat demuxer can copy packets straight through without
+        # decoding a single frame. The quality preset only applies to the re-encode, which
+        # stays as the fallback if the copy pass fails.
+        commands = []
+        if resolution == 'original' and fps == 'original' and \
+                _clips_support_stream_copy([v['path'] for v in ordered_videos]):
+            commands.append(input_args + ['-c', 'copy', '-movflags', '+faststart', output_path])
+        commands.append(cmd)
 
-        stdout, stderr = process.communicate()
+        # Run ffmpeg
+        for command in commands:
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+            )
 
-        # Cleanup concat file
-        try:
-            os.remove(concat_list_path)
-        except:
-            pass
+            stdout, stderr = process.communicate()
+            if process.returncode == 0:
+                break
 
         if process.returncode == 0:
             smashcut_jobs[job_id] = {
@@ -3301,12 +4169,19 @@ def background_smashcut_task(job_id, video_ids, options):
     except Exception as e:
         print(f"Smashcut Error: {e}")
         smashcut_jobs[job_id] = {'status': 'error', 'message': str(e)}
+    finally:
+        # Cleanup concat file, including when ffmpeg could not be started at all
+        if concat_list_path:
+            try:
+                os.remove(concat_list_path)
+            except OSError:
+                pass
 
 
 @app.route('/galleryout/smashcut')
 def smashcut_page():
     """Serves the smash cut generator page."""
-    folders = get_dynamic_folder_config(force_refresh=True)
+    folders = get_dynamic_folder_config(revalidate=True)
 
     return render_template('smashcut.html',
                           folders=folders)
@@ -3319,13 +4194,12 @@ def smashcut_get_input_files():
     Used to populate the input file filter dropdown.
     Accepts optional folder_keys query parameter to filter by specific folders.
     """
-    all_input_files = set()
     folder_keys = request.args.getlist('folder_keys')
 
     folders = get_dynamic_folder_config()
 
     with get_db_connection() as conn:
-        conditions = ["type = 'video'", "input_files != '[]'"]
+        conditions = ["files.type = 'video'"]
         params = []
 
         # Filter by folders if specified
@@ -3334,24 +4208,22 @@ def smashcut_get_input_files():
             for key in folder_keys:
                 if key in folders:
                     folder_path = folders[key]['path']
-                    folder_conditions.append("path LIKE ?")
+                    folder_conditions.append("files.path LIKE ?")
                     params.append(folder_path + os.sep + '%')
             if folder_conditions:
                 conditions.append(f"({' OR '.join(folder_conditions)})")
 
-        query = f"SELECT DISTINCT input_files FROM files WHERE {' AND '.join(conditions)}"
-        rows = conn.execute(query, params).fetchall()
-
-    for row in rows:
-        try:
-            input_files = json.loads(row['input_files'] or '[]')
-            all_input_files.update(input_files)
-        except:
-            pass
+        # file_input_files is already ordered by input_file, so DISTINCT and ORDER BY need no sort
+        query = (
+            "SELECT DISTINCT fi.input_file FROM file_input_files AS fi "
+            "JOIN files ON files.id = fi.file_id "
+            f"WHERE {' AND '.join(conditions)} ORDER BY fi.input_file"
+        )
+        input_files = [row[0] for row in conn.execute(query, params)]
 
     return jsonify({
         'status': 'success',
-        'input_files': sorted(list(all_input_files))
+        'input_files': input_files
     })
 
 
@@ -3371,41 +4243,23 @@ def serve_input_file_thumbnail(filename):
         if '..' in clean_filename:
             abort(403)
 
-        # Build the full path
-        filepath = os.path.abspath(os.path.join(BASE_INPUT_PATH, clean_filename))
-        base_path = os.path.abspath(BASE_INPUT_PATH)
-
-        # Ensure the path is within the input directory
-        if not filepath.startswith(base_path + os.sep) and filepath != base_path:
+        # Build the full path, ensuring it stays within the input directory
+        filepath = resolve_input_path(clean_filename)
+        if filepath is None:
             abort(403)
 
-        if not os.path.isfile(filepath):
+        # One stat gives both the file check and the mtime for the cache key
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            abort(404)
+        if not stat.S_ISREG(st.st_mode):
             abort(404)
 
-        # Generate a cache key based on the file path and modification time
-        mtime = os.path.getmtime(filepath)
-        file_hash = hashlib.md5((filepath + str(mtime)).encode()).hexdigest()
-
-        # Check for existing thumbnail
-        existing_thumbnails = glob.glob(os.path.join(THUMBNAIL_CACHE_DIR, f"input_{file_hash}.*"))
-        if existing_thumbnails:
-            response = send_file(existing_thumbnails[0], conditional=True)
-            response.headers['Cache-Control'] = 'public, max-age=86400'
-            return response
-
-        # Determine file type
-        ext = os.path.splitext(filepath)[1].lower()
-        if ext in ['.mp4', '.webm', '.mov', '.mkv', '.avi']:
-            file_type = 'video'
-        else:
-            file_type = 'image'
-
-        # Generate thumbnail
-        cache_path = create_thumbnail(filepath, f"input_{file_hash}", file_type)
+        thumb_key, file_type = _input_thumbnail_key(filepath, st.st_mtime)
+        cache_path = ensure_thumbnail(filepath, thumb_key, file_type)
         if cache_path and os.path.exists(cache_path):
-            response = send_file(cache_path, conditional=True)
-            response.headers['Cache-Control'] = 'public, max-age=86400'
-            return response
+            return send_thumbnail(cache_path)
 
         # Fallback: serve the original file for images
         if file_type == 'image':
@@ -3417,36 +4271,115 @@ def serve_input_file_thumbnail(filename):
         abort(404)
 
 
+INPUT_MEDIA_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.jfif',
+                          '.mp4', '.webm', '.mov', '.mkv', '.avi')
+
+# Seconds a listing of BASE_INPUT_PATH is reused before the tree is walked again
+INPUT_LISTING_TTL = 30
+_input_listing_cache = {'files': None, 'expires': 0.0}
+_input_index_cache = {'paths': None, 'expires': 0.0}
+_input_listing_lock = threading.Lock()
+
+def _iter_input_media_files(folder_path, rel_prefix='', extensions=INPUT_MEDIA_EXTENSIONS):
+    """
+    Yields media files under folder_path as '/'-separated paths relative to BASE_INPUT_PATH.
+    Uses os.scandir so entries are filtered by name without extra stat calls; hidden
+    entries are skipped and symlinked folders are not descended into (like os.walk).
+    """
+    try:
+        with os.scandir(folder_path) as entries:
+            entries = list(entries)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if not entry.is_symlink():
+                yield from _iter_input_media_files(entry.path, f"{rel_prefix}{entry.name}/", extensions)
+        elif entry.name.lower().endswith(extensions):
+            yield rel_prefix + entry.name
+
+def _input_thumbnail_key(filepath, mtime):
+    """Thumbnail cache key and file type for a file in the input directory."""
+    file_hash = _thumbnail_hash(filepath, mtime)
+    ext = os.path.splitext(filepath)[1].lower()
+    file_type = 'video' if ext in ('.mp4', '.webm', '.mov', '.mkv', '.avi') else 'image'
+    return f"input_{file_hash}", file_type
+
+_input_prewarm_lock = threading.Lock()
+# (filepath, mtime) of input files whose thumbnail could not be generated; not retried until the
+# file changes. Insertion ordered so the oldest entries are dropped first once the limit is hit;
+# only touched by the prewarm run holding _input_prewarm_lock.
+_INPUT_PREWARM_FAILED_SIZE = 1024
+_input_prewarm_failed = {}
+
+def _prewarm_input_thumbnails(rel_paths):
+    """
+    Generates missing input file thumbnails so the browser's thumbnail requests hit the cache.
+    Paths are resolved with resolve_input_path() like the thumbnail route, so both hash the
+    same string and the prewarmed thumbnail is the one the route looks up.
+    """
+    try:
+        for rel_path in rel_paths:
+            filepath = resolve_input_path(rel_path)
+            if filepath is None:
+                continue
+            try:
+                mtime = os.path.getmtime(filepath)
+            except OSError:
+                continue  # Removed since the listing was taken
+            if (filepath, mtime) in _input_prewarm_failed:
+                continue
+            thumb_key, file_type = _input_thumbnail_key(filepath, mtime)
+            if not ensure_thumbnail(filepath, thumb_key, file_type):
+                if len(_input_prewarm_failed) >= _INPUT_PREWARM_FAILED_SIZE:
+                    _input_prewarm_failed.pop(next(iter(_input_prewarm_failed)), None)
+                _input_prewarm_failed[(filepath, mtime)] = None
+    finally:
+        _input_prewarm_lock.release()
+
+def list_input_media_files():
+    """Sorted media files in the input directory (root files first), cached for INPUT_LISTING_TTL."""
+    with _input_listing_lock:
+        now = time.monotonic()
+        if _input_listing_cache['files'] is None or now >= _input_listing_cache['expires']:
+            all_files = list(_iter_input_media_files(BASE_INPUT_PATH))
+            all_files.sort(key=lambda x: (x.count('/'), x.lower()))
+            _input_listing_cache['files'] = all_files
+            _input_listing_cache['expires'] = now + INPUT_LISTING_TTL
+            # Warm thumbnails in the background; skipped if a previous pass is still running
+            if _input_prewarm_lock.acquire(blocking=False):
+                threading.Thread(target=_prewarm_input_thumbnails, args=(all_files,),
+                                 name='input-thumbnail-prewarm', daemon=True).start()
+        return _input_listing_cache['files']
+
+def get_input_file_index():
+    """
+    Maps os.path.normcase() of each input file's relative path to the path itself, so
+    workflow references can be resolved without statting. Covers every extension a
+    node summary links (audio included) and is cached for INPUT_LISTING_TTL.
+    """
+    with _input_listing_lock:
+        now = time.monotonic()
+        if _input_index_cache['paths'] is None or now >= _input_index_cache['expires']:
+            rel_paths = _iter_input_media_files(BASE_INPUT_PATH, extensions=tuple(_VALID_MEDIA_EXTS))
+            _input_index_cache['paths'] = {os.path.normcase(rel_path): rel_path for rel_path in rel_paths}
+            _input_index_cache['expires'] = now + INPUT_LISTING_TTL
+        return _input_index_cache['paths']
+
 @app.route('/galleryout/smashcut/input_directory_files')
 def smashcut_get_input_directory_files():
     """
     Returns list of all media files in the input directory and its subfolders.
     Used to allow browsing input files directly (not just those referenced in workflows).
     """
-    valid_extensions = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.jfif',
-                        '.mp4', '.webm', '.mov', '.mkv', '.avi'}
-    all_files = []
-
     try:
-        base_path = os.path.abspath(BASE_INPUT_PATH)
-        for root, dirs, files in os.walk(BASE_INPUT_PATH):
-            # Skip hidden directories
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-
-            for filename in files:
-                if filename.startswith('.'):
-                    continue
-                ext = os.path.splitext(filename)[1].lower()
-                if ext in valid_extensions:
-                    full_path = os.path.join(root, filename)
-                    # Get relative path from input directory
-                    rel_path = os.path.relpath(full_path, BASE_INPUT_PATH)
-                    # Normalize path separators
-                    rel_path = rel_path.replace('\\', '/')
-                    all_files.append(rel_path)
-
-        # Sort files, with root directory files first, then by path
-        all_files.sort(key=lambda x: (x.count('/'), x.lower()))
+        all_files = list_input_media_files()
 
         return jsonify({
             'status': 'success',
@@ -3494,42 +4427,37 @@ def smashcut_filter():
         if favorites_only:
             conditions.append("is_favorite = 1")
 
+        # Input files filtering, one primary key lookup per requested input file
+        if input_files_filter:
+            placeholders = ','.join('?' * len(input_files_filter))
+            conditions.append(
+                "EXISTS (SELECT 1 FROM file_input_files "
+                f"WHERE file_id = files.id AND input_file IN ({placeholders}))"
+            )
+            params.extend(input_files_filter)
+
+        # Only videos that carry a workflow can match a text pattern
+        if text_pattern:
+            conditions.append("has_workflow = 1")
+
         query = f"SELECT * FROM files WHERE {' AND '.join(conditions)} ORDER BY mtime DESC"
         videos = conn.execute(query, params).fetchall()
 
-    # Post-filter by input files and text pattern
+    # Post-filter by text pattern (requires workflow inspection).
+    # Each check is a metadata read from disk, so the files are read in parallel.
+    if text_pattern and videos:
+        pattern = text_pattern.lower()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(videos))) as executor:
+            workflows = list(executor.map(extract_workflow, [video['path'] for video in videos]))
+        videos = [video for video, workflow_json in zip(videos, workflows)
+                  if workflow_json and pattern in workflow_json.lower()]
+
     filtered_videos = []
     total_duration_seconds = 0
 
     for video in videos:
         video_dict = dict(video)
-
-        # Check input files filter (using cached data from database)
-        if input_files_filter:
-            try:
-                video_input_files = json.loads(video_dict.get('input_files') or '[]')
-            except:
-                video_input_files = []
-            if not any(inp in video_input_files for inp in input_files_filter):
-                continue
-
-        # Check text pattern filter (requires workflow inspection)
-        if text_pattern:
-            workflow_json = extract_workflow(video_dict['path'])
-            if not workflow_json or text_pattern.lower() not in workflow_json.lower():
-                continue
-
-        # Parse duration
-        duration_seconds = 0
-        if video_dict['duration']:
-            parts = video_dict['duration'].split(':')
-            try:
-                if len(parts) == 2:
-                    duration_seconds = int(parts[0]) * 60 + int(parts[1])
-                elif len(parts) == 3:
-                    duration_seconds = int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
-            except ValueError:
-                pass
+        duration_seconds = video_dict['duration_seconds'] or 0
 
         filtered_videos.append({
             'id': video_dict['id'],
@@ -3569,9 +4497,8 @@ def smashcut_generate():
     job_id = str(uuid.uuid4())
     smashcut_jobs[job_id] = {'status': 'queued', 'message': 'Job queued...'}
 
-    thread = threading.Thread(target=background_smashcut_task, args=(job_id, video_ids, options))
-    thread.daemon = True
-    thread.start()
+    _ensure_smashcut_workers()
+    smashcut_queue.put((job_id, video_ids, options))
 
     return jsonify({'status': 'success', 'job_id': job_id, 'message': 'Smash cut generation started.'})
 
@@ -3622,26 +4549,65 @@ def print_startup_banner():
     print(f"   GitHub     : {Colors.CYAN}{GITHUB_REPO_URL}{Colors.RESET}")
     print("")
     
+def _load_update_check_cache():
+    try:
+        with open(os.path.join(SQLITE_CACHE_DIR, UPDATE_CHECK_CACHE_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_update_check_cache(cache):
+    try:
+        with open(os.path.join(SQLITE_CACHE_DIR, UPDATE_CHECK_CACHE_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass  # Caching is best effort; the next start just checks again
+
 def check_for_updates():
-    """Checks the GitHub repo for a newer version without external libs."""
+    """
+    Checks the GitHub repo for a newer version without external libs.
+    The last ETag and remote version are cached next to the database: within the
+    response's max-age no request is made at all, and after that a conditional
+    request usually comes back as a 304 instead of re-downloading the file.
+    """
     print("Checking for updates...", end=" ", flush=True)
+    cache = _load_update_check_cache()
+    remote_version = cache.get('remote_version')
     try:
-        # Timeout (3s) not blocking start if no internet connection
-        with urllib.request.urlopen(GITHUB_RAW_URL, timeout=3) as response:
-            content = response.read().decode('utf-8')
-            # Finding string "Version: X.XX" 
-            match = re.search(r'Version:\s*([0-9.]+)', content)
-            
-            if match:
+        if remote_version is None or time.time() >= cache.get('fresh_until', 0):
+            request_headers = {}
+            if cache.get('etag') and remote_version is not None:
+                request_headers['If-None-Match'] = cache['etag']
+            req = urllib.request.Request(GITHUB_RAW_URL, headers=request_headers)
+            try:
+                # Timeout (3s) not blocking start if no internet connection
+                with urllib.request.urlopen(req, timeout=3) as response:
+                    content = response.read().decode('utf-8')
+                    response_headers = response.headers
+                # Finding string "Version: X.XX"
+                match = re.search(r'Version:\s*([0-9.]+)', content)
+                if not match:
+                    print("Could not parse remote version.")
+                    return
                 remote_version = float(match.group(1))
-                if remote_version > APP_VERSION:
-                    print(f"\n{Colors.YELLOW}{Colors.BOLD}NOTICE: A new version ({remote_version}) is available!{Colors.RESET}")
-                    print(f"Please update from: {GITHUB_REPO_URL}\n")
-                else:
-                    print("You are up to date.")
-            else:
-                print("Could not parse remote version.")
-                
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                response_headers = e.headers  # Not modified: the cached version is still current
+
+            max_age = re.search(r'max-age=(\d+)', response_headers.get('Cache-Control', ''))
+            _save_update_check_cache({
+                'etag': response_headers.get('ETag') or cache.get('etag'),
+                'remote_version': remote_version,
+                'fresh_until': time.time() + (int(max_age.group(1)) if max_age else 0),
+            })
+
+        if remote_version > APP_VERSION:
+            print(f"\n{Colors.YELLOW}{Colors.BOLD}NOTICE: A new version ({remote_version}) is available!{Colors.RESET}")
+            print(f"Please update from: {GITHUB_REPO_URL}\n")
+        else:
+            print("You are up to date.")
+
     except Exception:
         print("Skipped (Offline or GitHub unreachable).")
 
@@ -3707,8 +4673,12 @@ def _ensure_initialized():
         initialize_gallery()
         _gallery_initialized = True
 
-# Initialize when module is imported (required for WSGI servers)
-_ensure_initialized()
+# Initialize when module is imported (required for WSGI servers).
+# Spawned pool workers (Windows/macOS) re-import this module; they must not run
+# migrations or start the scheduler and SharePoint sync, and get the few settings
+# they need from _init_worker() instead.
+if multiprocessing.parent_process() is None:
+    _ensure_initialized()
 
 
 if __name__ == '__main__':
@@ -3718,26 +4688,30 @@ if __name__ == '__main__':
     print_configuration()
 
     # --- CHECK: OUTPUT PATH CHECK (Auto-create for containers/deployments) ---
-    if not os.path.exists(BASE_OUTPUT_PATH):
-        try:
-            os.makedirs(BASE_OUTPUT_PATH, exist_ok=True)
-            print(f"{Colors.GREEN}Created output directory: {BASE_OUTPUT_PATH}{Colors.RESET}")
-        except OSError as e:
-            print(f"{Colors.RED}Failed to create output directory: {e}{Colors.RESET}")
-            show_config_error_and_exit(BASE_OUTPUT_PATH)
+    # makedirs() is attempted directly: an existing folder costs one failed mkdir
+    # instead of a stat followed by the mkdir.
+    try:
+        os.makedirs(BASE_OUTPUT_PATH)
+        print(f"{Colors.GREEN}Created output directory: {BASE_OUTPUT_PATH}{Colors.RESET}")
+    except FileExistsError:
+        pass
+    except OSError as e:
+        print(f"{Colors.RED}Failed to create output directory: {e}{Colors.RESET}")
+        show_config_error_and_exit(BASE_OUTPUT_PATH)
 
     # --- CHECK: INPUT PATH CHECK (Auto-create for containers/deployments) ---
-    if not os.path.exists(BASE_INPUT_PATH):
-        try:
-            os.makedirs(BASE_INPUT_PATH, exist_ok=True)
-            print(f"{Colors.GREEN}Created input directory: {BASE_INPUT_PATH}{Colors.RESET}")
-        except OSError as e:
-            # Input directory is optional, just warn
-            print(f"{Colors.YELLOW}{Colors.BOLD}WARNING: Input Path not found and could not be created!{Colors.RESET}")
-            print(f"{Colors.YELLOW}   Path: '{BASE_INPUT_PATH}'{Colors.RESET}")
-            print(f"{Colors.YELLOW}   Error: {e}{Colors.RESET}")
-            print(f"{Colors.YELLOW}   > Source media lookups will be DISABLED.{Colors.RESET}")
-            print(f"{Colors.YELLOW}   > The gallery will still function normally.{Colors.RESET}\n")
+    try:
+        os.makedirs(BASE_INPUT_PATH)
+        print(f"{Colors.GREEN}Created input directory: {BASE_INPUT_PATH}{Colors.RESET}")
+    except FileExistsError:
+        pass
+    except OSError as e:
+        # Input directory is optional, just warn
+        print(f"{Colors.YELLOW}{Colors.BOLD}WARNING: Input Path not found and could not be created!{Colors.RESET}")
+        print(f"{Colors.YELLOW}   Path: '{BASE_INPUT_PATH}'{Colors.RESET}")
+        print(f"{Colors.YELLOW}   Error: {e}{Colors.RESET}")
+        print(f"{Colors.YELLOW}   > Source media lookups will be DISABLED.{Colors.RESET}")
+        print(f"{Colors.YELLOW}   > The gallery will still function normally.{Colors.RESET}\n")
     
     # Ensure gallery is initialized (may already be done on module import)
     _ensure_initialized()
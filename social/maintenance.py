@@ -325,7 +325,7 @@ def cleanup_orphaned_thumbnails(thumbnail_cache_dir, database_file):
     """
     Clean up thumbnail files for media that no longer exists in the database.
 
-    This checks thumbnail filenames (which are MD5 hashes of path+mtime) against
+    This checks thumbnail filenames (which are BLAKE2b hashes of path+mtime) against
     files that actually exist in the database.
 
     Args:
@@ -354,7 +354,8 @@ def cleanup_orphaned_thumbnails(thumbnail_cache_dir, database_file):
         for row in cursor:
             if row['path'] and row['mtime']:
                 hash_input = row['path'] + str(row['mtime'])
-                thumb_hash = hashlib.md5(hash_input.encode()).hexdigest()
+                # Must match _thumbnail_hash() in smartgallery.py
+                thumb_hash = hashlib.blake2b(hash_input.encode(), digest_size=16).hexdigest()
                 valid_hashes.add(thumb_hash)
 
         conn.close()